@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException,BackgroundTasks
 from pydantic import BaseModel
-from app.services.classification_services import classify_mri_file
-from app.services.common_services import get_local_file_path, delete_local_file
+from app.services.classification_services import classify_mri_file, classification_batcher, get_classification_config_key
+from app.services.batching import QueueFullError
+from app.services.model_registry import ModelsNotReadyError, get_model_status
+from app.services.result_cache import get_result_cache
+from app.services.s3 import get_object_etag
+from app.services.executors import run_io, endpoint_slot, EndpointBusyError
 router = APIRouter()
 
 # Request model for classification
@@ -16,15 +20,28 @@ class ClassificationRequest(BaseModel):
 async def classify_mri(request: ClassificationRequest, background_tasks: BackgroundTasks):
     try:
 
-        # Recreate the local file path based on s3_key
-        local_file_path = get_local_file_path(request.s3_key)
+        # Cached results are answered without taking a classification slot
+        cache_key, result = await run_io(get_cached_classification, request.s3_key, request.bucket_name)
 
-        # Call the classify function with s3_key and bucket_name
-        result = classify_mri_file(request.s3_key, request.bucket_name, local_file_path)
+        if result is None:
+            # Call the classify function with s3_key and bucket_name. It runs on the
+            # I/O pool so the event loop stays free and concurrent requests can
+            # share batched forward passes. Requests beyond CLASSIFY_CONCURRENCY
+            # are rejected rather than queued
+            async with endpoint_slot("classify"):
+                result = await run_io(
+                    classify_and_cache, request.s3_key, request.bucket_name, cache_key)
 
-        delete_local_file(local_file_path)
         return {"data": result}
     
+    except (QueueFullError, EndpointBusyError) as e:
+
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+    except ModelsNotReadyError as e:
+
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
     except FileNotFoundError as e:
 
         raise HTTPException(status_code=404, detail=str(e))
@@ -32,3 +49,30 @@ async def classify_mri(request: ClassificationRequest, background_tasks: Backgro
     except Exception as e:
 
         raise HTTPException(status_code=500, detail="An error occurred during classification")
+
+
+def get_cached_classification(s3_key: str, bucket_name: str) -> tuple:
+    """Return (cache key, cached result or None) for a volume."""
+    # The ETag identifies the volume content, so repeat classifications of the
+    # same scan are answered without downloading or running the models
+    etag = get_object_etag(s3_key, bucket_name)
+    cache_key = f"{etag}:{get_classification_config_key()}"
+    return cache_key, get_result_cache().get(cache_key)
+
+
+def classify_and_cache(s3_key: str, bucket_name: str, cache_key: str):
+    result = classify_mri_file(s3_key, bucket_name, None)
+
+    get_result_cache().set(cache_key, result)
+    return result
+
+
+@router.get("/classify/stats")
+async def classification_stats():
+    return {
+        "data": {
+            "models": await run_io(get_model_status),
+            "batcher": classification_batcher.get_stats(),
+            "result_cache": get_result_cache().get_stats()
+        }
+    }
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel, Field
+from typing import Literal
 import traceback
-import requests
 from app.services.file_processing import process_nii_file
-from app.services.common_services import get_local_file_path
-from app.services.s3 import download_file_from_s3
+from app.services.volume_cache import get_volume_cache
+from app.services.executors import run_io
+from app.services.jobs import enqueue_job, report_progress
+from app.services.callbacks import dispatch_callback
+from app.services.slice_service import register_volume
 from app.core.config import settings
 import platform
 import logging
@@ -12,6 +15,8 @@ import logging
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+PROCESS_FILE_HANDLER = "app.api.v1.endpoints.file_processing:process_file"
+
 # Request model for file processing
 class FileProcessingRequest(BaseModel):
     s3_key: str = Field(..., description="S3 key where the file is located.")
@@ -20,9 +25,13 @@ class FileProcessingRequest(BaseModel):
     user_id: str = Field(..., description="ID of the user the MRI belongs to.")
     resource_id: str = Field(..., description="ID of the resource the MRI belongs to.")
     mriFileId: str = Field(..., description="ID of MRI file object saved in MongoDB")
+    output_mode: Literal["zip", "objects"] = Field(
+        "zip",
+        description="'zip' uploads one mri_slices.zip; 'objects' uploads each slice plus a manifest.json."
+    )
 
 @router.post("/file-processing", status_code=status.HTTP_202_ACCEPTED)
-async def file_processing(request: FileProcessingRequest, background_tasks: BackgroundTasks):
+async def file_processing(request: FileProcessingRequest):
     try:
 
         adjusted_callback_url = request.callback_url
@@ -34,52 +43,64 @@ async def file_processing(request: FileProcessingRequest, background_tasks: Back
                 elif platform.system() == "Linux":
                     adjusted_callback_url = request.callback_url.replace("localhost", "172.17.0.1")
 
-        # Schedule file processing in the background
-        background_tasks.add_task(
-            process_file, 
-            request.s3_key, 
-            request.bucket_name, 
-            adjusted_callback_url, 
-            request.user_id,
-            request.resource_id,
-            request.mriFileId
+        # Persist the job; a worker process picks it up and reports progress
+        job, created = await run_io(
+            enqueue_job,
+            PROCESS_FILE_HANDLER,
+            {
+                "s3_key": request.s3_key,
+                "bucket_name": request.bucket_name,
+                "callback_url": adjusted_callback_url,
+                "user_id": request.user_id,
+                "resource_id": request.resource_id,
+                "mriFileId": request.mriFileId,
+                "output_mode": request.output_mode
+            },
+            dedup_key=f"{request.mriFileId}:{request.bucket_name}/{request.s3_key}:{request.output_mode}"
         )
 
         # Immediately respond to Node.js server
-        return {"message": "File processing started."}
+        if not created:
+            return {"message": "File processing already in progress.", "job_id": job["id"]}
+        return {"message": "File processing started.", "job_id": job["id"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error starting file processing: {str(e)}")
 
 # Function to process the file and send metadata back to Node.js
-def process_file(s3_key: str, bucket_name: str, callback_url: str, user_id: str, resource_id: str, mriFileId: str):
+def process_file(s3_key: str, bucket_name: str, callback_url: str, user_id: str, resource_id: str, mriFileId: str,
+                 output_mode: str = "zip"):
     try:
-        
-        local_file_path = get_local_file_path(s3_key)
-
-        # Download and process the file
-        file_path = download_file_from_s3(s3_key, bucket_name,local_file_path)
-        result = process_nii_file(file_path, s3_key, bucket_name)  # Contains both metadata and zip_file_key
+        # Download (or reuse the cached copy of) and process the file
+        report_progress(0.0, "downloading")
+        with get_volume_cache().fetch(s3_key, bucket_name) as file_path:
+            report_progress(0.1, "rendering")
+            # Contains the metadata plus the zip_file_key or manifest_key
+            result = process_nii_file(str(file_path), s3_key, bucket_name, output_mode)
+        # Lets the viewer request re-windowed slices by MRI file id
+        register_volume(mriFileId, s3_key, bucket_name)
+        # Raises if another worker took the job over, so Node.js gets one callback
+        report_progress(0.9, "queueing callback")
 
         # Construct the payload with the required fields
         payload = {
             "zip_file_key": result["zip_file_key"],
+            "manifest_key": result.get("manifest_key"),
+            "output_mode": output_mode,
             "metadata": result["metadata"],
             "user_id": user_id,
             "resource_id": resource_id,
             "mriFileId": mriFileId
         }
 
-        # Send the payload to the Node.js callback URL
-        response = requests.post(callback_url, json=payload)
+        # Hand the payload to the callback dispatcher; it is persisted in the
+        # outbox and retried until the Node.js server accepts it
+        dispatch_callback(callback_url, payload)
+        logger.info(f"Queued metadata callback to Node.js: {callback_url}")
+        report_progress(1.0, "callback queued")
 
-        if response.status_code != 200:
-            logger.error(f"Failed to send metadata to Node.js (status: {response.status_code}): {response.text}")
-        else:
-            logger.info(f"Successfully sent metadata to Node.js: {response.text}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"RequestException while sending metadata to Node.js: {str(e)}")
-        logger.error(f"Error details: {traceback.format_exc()}")
+        return payload
     except Exception as e:
         logger.error(f"General error occurred while processing file: {str(e)}")
         logger.error(f"Error details: {traceback.format_exc()}")
+        raise  # Let the job queue retry with backoff
 
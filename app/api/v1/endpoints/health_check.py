@@ -1,5 +1,9 @@
 from fastapi import APIRouter,Depends
+from fastapi.responses import JSONResponse
 from app.core.security import api_key_authentication
+from app.core.config import settings
+from app.services.model_registry import get_model_status
+from app.services.executors import run_io
 
 
 router = APIRouter()
@@ -7,3 +11,20 @@ router = APIRouter()
 @router.get("/health-check", dependencies=[Depends(api_key_authentication)])
 async def health_check():
     return {"status": "healthy"}
+
+
+# Probes are unauthenticated so orchestrators can call them without API keys
+@router.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    if not settings.CLASSIFICATION_ENABLED:
+        return {"status": "ready", "classification": "disabled"}
+
+    models = await run_io(get_model_status)
+    if models["status"] != "ready":
+        return JSONResponse(status_code=503, content={"status": "not_ready", "models": models})
+    return {"status": "ready", "models": models}
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from app.services.executors import run_io
+from app.services.jobs import get_job
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await run_io(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "data": {
+            "id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "stage": job["stage"],
+            "attempts": job["attempts"],
+            "max_attempts": job["max_attempts"],
+            "error": job["error"],
+            "result": job["result"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+    }
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from app.core.metrics import CONTENT_TYPE_LATEST, generate_latest
+from app.services.executors import run_io
+
+router = APIRouter()
+
+
+# Unauthenticated like the health probes, so Prometheus can scrape it without an API key
+@router.get("/metrics")
+async def metrics():
+    # Reads the files every process writes to PROMETHEUS_MULTIPROC_DIR
+    return Response(await run_io(generate_latest), media_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from app.services.mri_colorization_service import colorize_mri_image
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Header, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.services.mri_colorization_service import (
+    render_colorized_image, get_cluster_palette, fit_color_lut, colorize_and_encode, ColorizedImageCache,
+    DEFAULT_CLUSTERS
+)
+from app.services.file_processing import normalize_slices, iter_zip_stream, get_slice_encoder_pool
+from app.services.volume_services import load_volume, get_volume_data, extract_views
+from app.services.volume_cache import get_volume_cache
+from app.services.s3 import upload_many_to_s3
 from app.core.config import settings
+from app.core.metrics import register_cache
+from app.services.executors import run_io, run_cpu, endpoint_limit
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal, Optional
+import functools
 import numpy as np
 import cv2
-import tempfile
 import logging
 import os
 
@@ -13,47 +25,223 @@ logger = logging.getLogger(__name__)
 
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 
+# Output formats the slice endpoint can negotiate through the Accept header
+IMAGE_MEDIA_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+DEFAULT_MEDIA_TYPE = "image/jpeg"
+
+response_cache = (
+    ColorizedImageCache(settings.COLORIZE_RESPONSE_CACHE_MAX_BYTES)
+    if settings.COLORIZE_RESPONSE_CACHE_MAX_BYTES > 0 else None
+)
+if response_cache is not None:
+    register_cache("colorized_image", response_cache.get_stats, entries="entries", size="bytes")
+
+ClusteringMethod = Literal["kmeans", "histogram", "otsu"]
+METHOD_DESCRIPTION = (
+    "'histogram' and 'otsu' cluster the intensity histogram deterministically; "
+    "'kmeans' runs the randomized cv2.kmeans over every pixel."
+)
+
+
+class VolumeColorizationRequest(BaseModel):
+    s3_key: str = Field(..., description="S3 key of the NIfTI volume.")
+    bucket_name: str = Field(..., description="S3 bucket name containing the volume.")
+    view: Literal["axial", "coronal", "sagittal"] = "axial"
+    method: ClusteringMethod = Field("histogram", description=METHOD_DESCRIPTION)
+    output: Literal["zip", "s3"] = Field(
+        "zip",
+        description="'zip' streams the colorized slices back; 's3' uploads them next to the volume."
+    )
+
 def validate_file_extension(filename: str) -> bool:
     # Check if the file has one of the allowed extensions
     ext = os.path.splitext(filename)[1].lower()
     return ext in ALLOWED_EXTENSIONS
 
 @router.post("/colorize-mri-slice/")
-async def colorize_mri_slice(image_file: UploadFile = File(...)):
+async def colorize_mri_slice(
+    image_file: UploadFile = File(...),
+    method: ClusteringMethod = Query("histogram", description=METHOD_DESCRIPTION),
+    accept: Optional[str] = Header(None)
+):
     # Validate file extension
     if not validate_file_extension(image_file.filename):
         raise HTTPException(status_code=400, detail="Invalid file type. Only .jpg, .jpeg, and .png files are allowed.")
 
+    media_type = negotiate_image_type(accept)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail="Supported image types: " + ", ".join(IMAGE_MEDIA_TYPES))
+    extension = IMAGE_MEDIA_TYPES[media_type]
+
     try:
         # Load MRI slice image from the request
         logger.info("Receiving MRI slice image for colorization.")
-        image_data = np.frombuffer(await image_file.read(), np.uint8)
-        mri_slice_image = cv2.imdecode(image_data, cv2.IMREAD_GRAYSCALE)
-
-        if mri_slice_image is None:
-            raise HTTPException(status_code=400, detail="Invalid MRI slice image.")
-
-        # Load the color spectrum from static file path
-        logger.info(f"Loading color spectrum file at path: {settings.COLOR_SPECTRUM_FILE_PATH}")
-        color_spectrum_path = settings.COLOR_SPECTRUM_FILE_PATH
-        if not os.path.exists(color_spectrum_path):
-            raise HTTPException(status_code=500, detail="Color spectrum file not found.")
-        
-        color_spectrum = cv2.imread(color_spectrum_path, cv2.IMREAD_COLOR)
-        if color_spectrum is None:
-            raise HTTPException(status_code=500, detail="Error loading color spectrum image.")
-
-        # Colorize the MRI slice image
-        colorized_image = colorize_mri_image(mri_slice_image, color_spectrum)
-
-        # Save colorized image temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-            colorized_image_path = tmp_file.name
-            cv2.imwrite(colorized_image_path, colorized_image)
-            logger.info(f"Colorized MRI slice image saved temporarily at {colorized_image_path}")
-        
-        return FileResponse(colorized_image_path, media_type="image/jpeg", filename="colorized_mri_slice.jpg")
-    
+        upload = await image_file.read()
+
+        # A repeated upload of the same slice is answered without recomputing
+        cache_key = ColorizedImageCache.make_key(upload, method, DEFAULT_CLUSTERS, extension)
+        encoded = response_cache.get(cache_key) if response_cache else None
+        if encoded is None:
+            mri_slice_image = cv2.imdecode(np.frombuffer(upload, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if mri_slice_image is None:
+                raise HTTPException(status_code=400, detail="Invalid MRI slice image.")
+
+            color_spectrum = await load_color_palette()
+
+            # Colorize and encode on the process pool, k-means holds the GIL
+            async with endpoint_limit("colorize"):
+                encoded = await run_cpu(
+                    render_colorized_image, mri_slice_image, color_spectrum, DEFAULT_CLUSTERS, method, extension)
+            if response_cache:
+                response_cache.set(cache_key, encoded)
+
+        return Response(
+            content=encoded,
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="colorized_mri_slice{extension}"',
+                "Vary": "Accept"
+            }
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing MRI slice colorization: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while processing the MRI slice image.")
+
+
+def negotiate_image_type(accept: Optional[str]) -> Optional[str]:
+    """Pick the supported image type with the highest q-value in an Accept header."""
+    if not accept:
+        return DEFAULT_MEDIA_TYPE
+    best, best_quality = None, 0.0
+    for part in accept.split(","):
+        media_range, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_range in IMAGE_MEDIA_TYPES:
+            candidate = media_range
+        elif media_range in ("*/*", "image/*"):
+            candidate = DEFAULT_MEDIA_TYPE
+        else:
+            continue
+        if quality > best_quality:
+            best, best_quality = candidate, quality
+    return best
+
+
+async def load_color_palette():
+    # The spectrum is decoded and resized once, then reused by every request
+    try:
+        return await run_io(get_cluster_palette, DEFAULT_CLUSTERS)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Color spectrum file not found.")
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Error loading color spectrum image.")
+
+
+def render_colorized_slices(images, lut, names):
+    """Yield (name, JPEG bytes) for every slice, colorized in parallel workers."""
+    executor = get_slice_encoder_pool()
+    chunksize = 1 if isinstance(executor, ThreadPoolExecutor) else 16
+    encode = functools.partial(colorize_and_encode, lut=lut)
+    yield from zip(names, executor.map(encode, images, chunksize=chunksize))
+
+
+@router.post("/colorize-mri-batch/")
+async def colorize_mri_batch(
+    image_files: List[UploadFile] = File(...),
+    method: ClusteringMethod = Query("histogram", description=METHOD_DESCRIPTION)
+):
+    """Colorize many slices of one stack with a single shared clustering fit, streamed back as a zip."""
+    for image_file in image_files:
+        if not validate_file_extension(image_file.filename):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid file type for {image_file.filename}. Only .jpg, .jpeg, and .png files are allowed."
+            )
+
+    images, names = [], []
+    for i, image_file in enumerate(image_files):
+        image = cv2.imdecode(np.frombuffer(await image_file.read(), np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise HTTPException(status_code=400, detail=f"Invalid MRI slice image: {image_file.filename}")
+        images.append(image)
+        stem = os.path.splitext(os.path.basename(image_file.filename))[0]
+        names.append(f"{i:04d}_colorized_{stem}.jpg")
+
+    color_spectrum = await load_color_palette()
+    try:
+        async with endpoint_limit("colorize"):
+            lut = await run_cpu(fit_color_lut, images, color_spectrum, DEFAULT_CLUSTERS, method)
+    except Exception as e:
+        logger.error(f"Error fitting batch colorization: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while processing the MRI slice images.")
+
+    logger.info(f"Streaming {len(images)} colorized slices")
+    return StreamingResponse(
+        iter_zip_stream(render_colorized_slices(images, lut, names)),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="colorized_mri_slices.zip"'}
+    )
+
+
+@router.post("/colorize-mri-volume/")
+async def colorize_mri_volume(request: VolumeColorizationRequest):
+    """Colorize every slice of one view of a NIfTI volume with a single clustering fit."""
+    color_spectrum = await load_color_palette()
+    try:
+        async with endpoint_limit("colorize"):
+            images, lut = await run_io(fit_volume_colorization, request, color_spectrum)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fitting volume colorization: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while colorizing the MRI volume.")
+
+    names = [f"{request.view}slice{i}.jpg" for i in range(len(images))]
+    if request.output == "zip":
+        return StreamingResponse(
+            iter_zip_stream(
+                (f"{request.view}/{name}", data)
+                for name, data in render_colorized_slices(images, lut, names)
+            ),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="colorized_{request.view}.zip"'}
+        )
+
+    folder_key = f"{os.path.dirname(request.s3_key)}/colorized/{request.view}/"
+    async with endpoint_limit("colorize"):
+        await run_io(publish_colorized_slices, images, lut, names, folder_key, request.bucket_name)
+    return {
+        "data": {
+            "folder_key": folder_key,
+            "num_slices": len(names),
+            "method": request.method
+        }
+    }
+
+
+def fit_volume_colorization(request: VolumeColorizationRequest, color_spectrum):
+    # Slices are normalized exactly like the ones /file-processing renders
+    with get_volume_cache().fetch(request.s3_key, request.bucket_name) as file_path:
+        nii_img = load_volume(file_path)
+        views = extract_views(get_volume_data(nii_img), nii_img.affine)
+        images = normalize_slices(views[request.view])
+    lut = fit_color_lut(images, color_spectrum, DEFAULT_CLUSTERS, request.method)
+    return images, lut
+
+
+def publish_colorized_slices(images, lut, names, folder_key: str, bucket_name: str):
+    # Encoded inline: this already runs on the I/O pool, and waiting on tasks
+    # queued to that same pool could leave every worker waiting on the others
+    items = [(colorize_and_encode(image, lut), folder_key + name) for image, name in zip(images, names)]
+    upload_many_to_s3(items, bucket_name, content_type="image/jpeg")
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+from app.core.config import settings
+from app.core.security import api_key_authentication
+from app.services.executors import run_io
+from app.services.slice_service import get_slice_service, register_volume, VolumeNotFoundError
+from app.services.volume_cache import get_volume_cache
+
+# Every route needs an API key: slices are patient pixel data, and the stats
+# reveal what is being viewed
+router = APIRouter(dependencies=[Depends(api_key_authentication)])
+
+
+class VolumeRegistration(BaseModel):
+    s3_key: str = Field(..., description="S3 key of the NIfTI volume.")
+    bucket_name: str = Field(..., description="S3 bucket name containing the volume.")
+
+
+@router.get("/volumes/cache/stats")
+async def volume_cache_stats():
+    return {"data": get_volume_cache().get_stats()}
+
+
+@router.get("/volumes/slices/stats")
+async def slice_cache_stats():
+    return {"data": get_slice_service().get_stats()}
+
+
+@router.put("/volumes/{volume_id}")
+async def put_volume(volume_id: str, request: VolumeRegistration):
+    await run_io(register_volume, volume_id, request.s3_key, request.bucket_name)
+    # Other workers pick the new location up within SLICE_VOLUME_REVALIDATE_SECONDS
+    get_slice_service().forget(volume_id)
+    return {"data": {"id": volume_id, "s3_key": request.s3_key, "bucket_name": request.bucket_name}}
+
+
+@router.get("/volumes/{volume_id}/slices/{view}/{index}")
+async def get_volume_slice(
+    volume_id: str,
+    view: Literal["axial", "coronal", "sagittal"],
+    index: int,
+    window: Optional[float] = Query(None, gt=0, description="Window width in raw intensity units."),
+    level: Optional[float] = Query(None, description="Window center in raw intensity units."),
+    size: Optional[int] = Query(None, gt=0, le=4096, description="Longer edge of the returned image in pixels."),
+    format: Literal["jpeg", "webp", "png16"] = "jpeg",
+    if_none_match: Optional[str] = Header(None)
+):
+    client_etags = [tag.strip() for tag in if_none_match.split(",")] if if_none_match else []
+    try:
+        encoded, content_type, etag = await run_io(
+            get_slice_service().get_slice,
+            volume_id, view, index, window, level, size, format, client_etags
+        )
+    except (VolumeNotFoundError, FileNotFoundError, IndexError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rendering slice: {str(e)}")
+
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.SLICE_CACHE_CONTROL_MAX_AGE}"}
+    if encoded is None:  # The client's copy is current, nothing was rendered
+        return Response(status_code=304, headers=headers)
+    return Response(content=encoded, media_type=content_type, headers=headers)
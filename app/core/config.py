@@ -14,8 +14,73 @@ class Settings(BaseSettings):
     AXIAL_MODEL_PATH: str = os.getenv("AXIAL_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'axial_best.hdf5'))
     CORONAL_MODEL_PATH: str = os.getenv("CORONAL_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'coronal_best.hdf5'))
     SAGITTAL_MODEL_PATH: str = os.getenv("SAGITTAL_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'sagittal_best.hdf5'))
+    INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "keras")  # "keras" or "tflite"
+    AXIAL_TFLITE_MODEL_PATH: str = os.getenv("AXIAL_TFLITE_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'axial.tflite'))
+    CORONAL_TFLITE_MODEL_PATH: str = os.getenv("CORONAL_TFLITE_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'coronal.tflite'))
+    SAGITTAL_TFLITE_MODEL_PATH: str = os.getenv("SAGITTAL_TFLITE_MODEL_PATH", os.path.join(ROOT_DIR, 'assets', 'models', 'sagittal.tflite'))
+    TFLITE_NUM_THREADS: int = int(os.getenv("TFLITE_NUM_THREADS", 0))  # 0 lets the runtime decide
     COLOR_SPECTRUM_FILE_PATH: str = os.getenv("COLOR_SPECTRUM_FILE", os.path.join(ROOT_DIR, 'assets', 'ColorSpectrum.jpg'))
     IS_DOCKER: bool = os.getenv("IS_DOCKER", "false").lower() == "true"
+    IO_POOL_WORKERS: int = int(os.getenv("IO_POOL_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+    CPU_POOL_WORKERS: int = int(os.getenv("CPU_POOL_WORKERS", os.cpu_count() or 1))
+    CLASSIFY_CONCURRENCY: int = int(os.getenv("CLASSIFY_CONCURRENCY", 8))
+    COLORIZE_CONCURRENCY: int = int(os.getenv("COLORIZE_CONCURRENCY", os.cpu_count() or 1))
+    SLICE_ENCODER_POOL: str = os.getenv("SLICE_ENCODER_POOL", "thread")  # "thread" or "process"
+    SLICE_NORMALIZE_CHUNK: int = int(os.getenv("SLICE_NORMALIZE_CHUNK", 32))
+    SLICE_IMAGE_FORMAT: str = os.getenv("SLICE_IMAGE_FORMAT", "jpeg")  # "jpeg", "webp" or "png16"
+    SLICE_IMAGE_QUALITY: int = int(os.getenv("SLICE_IMAGE_QUALITY", 75))
+    SLICE_PYRAMID_LEVELS: str = os.getenv("SLICE_PYRAMID_LEVELS", "1")  # Comma-separated downsample factors, e.g. "1,2,4"
+    SLICE_ARCHIVE_STREAM_TO_S3: bool = os.getenv("SLICE_ARCHIVE_STREAM_TO_S3", "false").lower() == "true"
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")  # e.g. a local moto server
+    S3_MAX_POOL_CONNECTIONS: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+    S3_MAX_RETRY_ATTEMPTS: int = int(os.getenv("S3_MAX_RETRY_ATTEMPTS", 5))
+    S3_MULTIPART_THRESHOLD: int = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+    S3_MULTIPART_PART_SIZE: int = int(os.getenv("S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024))
+    S3_TRANSFER_MAX_CONCURRENCY: int = int(os.getenv("S3_TRANSFER_MAX_CONCURRENCY", 16))
+    CLASSIFICATION_ENABLED: bool = os.getenv("CLASSIFICATION_ENABLED", "true").lower() == "true"
+    MODEL_PRELOAD: bool = os.getenv("MODEL_PRELOAD", "true").lower() == "true"  # Load in the background at startup
+    MODEL_SERVER_ENABLED: bool = os.getenv("MODEL_SERVER_ENABLED", "false").lower() == "true"
+    MODEL_SERVER_AUTOSTART: bool = os.getenv("MODEL_SERVER_AUTOSTART", "false").lower() == "true"
+    MODEL_SERVER_ADDRESS: str = os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:50055")
+    MODEL_SERVER_AUTHKEY: str = os.getenv("MODEL_SERVER_AUTHKEY", "")  # Required with MODEL_SERVER_ENABLED
+    CLASSIFY_MODEL_WAIT_SECONDS: float = float(os.getenv("CLASSIFY_MODEL_WAIT_SECONDS", 30))
+    CLASSIFY_SLICES_PER_PLANE: int = int(os.getenv("CLASSIFY_SLICES_PER_PLANE", 1))
+    CLASSIFY_SLICE_SAMPLING: str = os.getenv("CLASSIFY_SLICE_SAMPLING", "center")  # "center" or "brain_mask"
+    CLASSIFY_SLICE_SPAN: float = float(os.getenv("CLASSIFY_SLICE_SPAN", 0.3))  # Fraction of the range sampled
+    CLASSIFY_AGGREGATION: str = os.getenv("CLASSIFY_AGGREGATION", "mean")  # "mean" or "weighted"
+    CLASSIFY_BATCH_MAX_SIZE: int = int(os.getenv("CLASSIFY_BATCH_MAX_SIZE", 16))
+    CLASSIFY_BATCH_MAX_WAIT_MS: float = float(os.getenv("CLASSIFY_BATCH_MAX_WAIT_MS", 10))
+    # Below CLASSIFY_CONCURRENCY, so a forward-pass backlog is rejected with 429 before every slot waits on it
+    CLASSIFY_QUEUE_MAX_DEPTH: int = int(os.getenv("CLASSIFY_QUEUE_MAX_DEPTH", 4))
+    CLASSIFY_RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("CLASSIFY_RESULT_CACHE_MAX_ENTRIES", 1024))
+    CLASSIFY_RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("CLASSIFY_RESULT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    CLASSIFY_RESULT_CACHE_DB_PATH: str = os.getenv("CLASSIFY_RESULT_CACHE_DB_PATH", os.path.join(ROOT_DIR, 'data', 'classification_cache.sqlite3'))
+    CLASSIFY_RESULT_CACHE_DB_MAX_ENTRIES: int = int(os.getenv("CLASSIFY_RESULT_CACHE_DB_MAX_ENTRIES", 100000))
+    JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", os.path.join(ROOT_DIR, 'data', 'jobs.sqlite3'))
+    JOB_WORKER_PROCESSES: int = int(os.getenv("JOB_WORKER_PROCESSES", 1))  # In total, however many web workers run
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", 2))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BACKOFF_SECONDS: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 5))
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", 600))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1))
+    CALLBACK_OUTBOX_DIR: str = os.getenv("CALLBACK_OUTBOX_DIR", os.path.join(ROOT_DIR, 'data', 'callback_outbox'))
+    CALLBACK_TIMEOUT_SECONDS: float = float(os.getenv("CALLBACK_TIMEOUT_SECONDS", 10))
+    CALLBACK_MAX_ATTEMPTS: int = int(os.getenv("CALLBACK_MAX_ATTEMPTS", 5))
+    CALLBACK_RETRY_BACKOFF_SECONDS: float = float(os.getenv("CALLBACK_RETRY_BACKOFF_SECONDS", 1))
+    CALLBACK_MAX_CONNECTIONS: int = int(os.getenv("CALLBACK_MAX_CONNECTIONS", 100))
+    CALLBACK_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv("CALLBACK_MAX_CONNECTIONS_PER_HOST", 10))
+    CALLBACK_REPLAY_INTERVAL_SECONDS: float = float(os.getenv("CALLBACK_REPLAY_INTERVAL_SECONDS", 60))
+    VOLUME_CACHE_DIR: str = os.getenv("VOLUME_CACHE_DIR", os.path.join(ROOT_DIR, 'cache', 'volumes'))
+    VOLUME_CACHE_MAX_BYTES: int = int(os.getenv("VOLUME_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+    COLORIZE_RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv("COLORIZE_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 0 disables
+    # Shared by every process so /metrics aggregates them; empty keeps metrics per process
+    PROMETHEUS_MULTIPROC_DIR: str = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join(ROOT_DIR, 'data', 'metrics'))
+    SLICE_LOG_SAMPLE_EVERY: int = int(os.getenv("SLICE_LOG_SAMPLE_EVERY", 64))  # Debug-log every Nth encoded slice
+    VOLUMES_DB_PATH: str = os.getenv("VOLUMES_DB_PATH", os.path.join(ROOT_DIR, 'data', 'volumes.sqlite3'))
+    SLICE_OPEN_VOLUMES_MAX: int = int(os.getenv("SLICE_OPEN_VOLUMES_MAX", 8))
+    SLICE_CACHE_MAX_BYTES: int = int(os.getenv("SLICE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    SLICE_VOLUME_REVALIDATE_SECONDS: float = float(os.getenv("SLICE_VOLUME_REVALIDATE_SECONDS", 60))
+    SLICE_CACHE_CONTROL_MAX_AGE: int = int(os.getenv("SLICE_CACHE_CONTROL_MAX_AGE", 3600))
 
     class Config:
         env_file = ".env"
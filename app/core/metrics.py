@@ -0,0 +1,158 @@
+"""Prometheus metrics, aggregated over every process of the service.
+
+Metrics are plain prometheus_client objects. Job workers, CPU pool workers,
+the model server and each uvicorn worker are separate processes, so with
+PROMETHEUS_MULTIPROC_DIR set prometheus_client keeps every process's values
+in memory-mapped files there and /metrics reads them all through a
+MultiProcessCollector: counters and histograms are summed, gauges are
+combined as their multiprocess_mode says ("livesum" only counts processes
+that are still running). The first process of a run empties the directory,
+so counts from earlier runs are never added in.
+
+State already tracked elsewhere, like cache statistics, is exported by
+collectors of the process answering the scrape.
+"""
+import fcntl
+import logging
+import os
+from pathlib import Path
+from app.core.config import settings
+
+
+def claim_multiproc_dir(path: str):
+    """Share the directory with the other processes of this run for this process's lifetime.
+
+    Every process holds a shared lock on it; one that can take the lock
+    exclusively is alone, so whatever is in the directory was left by an
+    earlier run and is deleted before this process writes anything.
+    """
+    os.makedirs(path, exist_ok=True)
+    lock_file = open(os.path.join(path, ".lock"), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        pass
+    else:
+        for name in os.listdir(path):
+            if name.endswith(".db"):
+                os.remove(os.path.join(path, name))
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    return lock_file
+
+
+# prometheus_client chooses between in-memory and file-backed values when it is
+# first imported, so the directory must be in the environment before that (and
+# other modules import metric classes from here); spawned processes inherit it
+if settings.PROMETHEUS_MULTIPROC_DIR:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = settings.PROMETHEUS_MULTIPROC_DIR
+    _multiproc_dir_lock = claim_multiproc_dir(settings.PROMETHEUS_MULTIPROC_DIR)
+else:
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)  # Even empty, it would put the files in the working directory
+
+import prometheus_client
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds; covers single slice encodes up to whole-volume S3 transfers and jobs
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "vizmed_stage_duration_seconds",
+    "Time spent in each processing stage",
+    ["stage"],
+    buckets=DURATION_BUCKETS
+)
+
+
+def time_stage(stage: str):
+    """Context manager recording how long a processing stage took."""
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+class _LocalCollector:
+    """Metric families computed at scrape time from this process's own state."""
+
+    def __init__(self):
+        self.functions = []
+
+    def describe(self):
+        return []  # Nothing is read at registration, the caches may not exist yet
+
+    def collect(self):
+        for function in list(self.functions):
+            try:
+                yield from function()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+
+
+_local_collector = _LocalCollector()
+_caches = []
+REGISTRY.register(_local_collector)
+
+
+def register_collector(collect):
+    """Add a function called at scrape time that yields prometheus_client metric families."""
+    _local_collector.functions.append(collect)
+
+
+def register_cache(name: str, get_stats, hits=("hits",), entries: str = None, size: str = None):
+    """Export a cache's get_stats() counters; hits names the keys that count as hits."""
+    _caches.append((name, get_stats, hits, entries, size))
+
+
+def collect_cache_metrics():
+    hits_total = CounterMetricFamily("vizmed_cache_hits", "Cache lookups answered from the cache", labels=["cache"])
+    misses_total = CounterMetricFamily("vizmed_cache_misses", "Cache lookups that missed", labels=["cache"])
+    entries_held = GaugeMetricFamily("vizmed_cache_entries", "Entries held by the cache", labels=["cache"])
+    bytes_held = GaugeMetricFamily("vizmed_cache_bytes", "Bytes held by the cache", labels=["cache"])
+    for name, get_stats, hits, entries, size in list(_caches):
+        try:
+            stats = get_stats()
+        except Exception as e:
+            logger.warning(f"Failed to read {name} cache statistics: {e}")
+            continue
+        hits_total.add_metric([name], sum(stats[hit] for hit in hits))
+        misses_total.add_metric([name], stats["misses"])
+        if entries is not None:
+            entries_held.add_metric([name], stats[entries])
+        if size is not None:
+            bytes_held.add_metric([name], stats[size])
+    return [hits_total, misses_total, entries_held, bytes_held]
+
+
+register_collector(collect_cache_metrics)
+
+
+def remove_dead_process_gauges(multiproc_dir: str):
+    """Drop the live gauge files of processes that exited, even without a clean shutdown."""
+    for path in Path(multiproc_dir).glob("gauge_live*_*.db"):
+        pid = int(path.stem.rpartition("_")[2])
+        if not is_process_alive(pid):
+            mark_process_dead(pid, multiproc_dir)
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def generate_latest() -> bytes:
+    """Prometheus text exposition of the metrics of every process."""
+    if not settings.PROMETHEUS_MULTIPROC_DIR:
+        return prometheus_client.generate_latest(REGISTRY)
+    remove_dead_process_gauges(settings.PROMETHEUS_MULTIPROC_DIR)
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    registry.register(_local_collector)
+    return prometheus_client.generate_latest(registry)
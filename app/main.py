@@ -1,14 +1,53 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from app.core.security import api_key_authentication
-from app.api.v1.endpoints import health_check,file_processing,classification,mri_colorization
+from app.api.v1.endpoints import health_check,file_processing,mri_colorization,jobs,volumes,metrics
+from app.core.config import settings
+from app.services.executors import shutdown_executors
+from app.services.jobs import start_workers, stop_workers
+from app.services.callbacks import get_callback_dispatcher
+from app.services.mri_colorization_service import warm_up_colorization
+from app.services.model_registry import get_model_registry
+from app.services.model_server import ensure_model_server, get_authkey
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Job workers resume anything left queued or running before a restart
+    start_workers()
+    # Replays callbacks that were still undelivered when the server stopped
+    get_callback_dispatcher().start()
+    # Decode the colorization spectrum before the first request needs it
+    warm_up_colorization()
+    # Models load and warm up in the background; /health/ready reports when they're done
+    if settings.CLASSIFICATION_ENABLED and settings.MODEL_SERVER_ENABLED:
+        # One shared process owns the models instead of every worker loading them;
+        # refuse to start without the shared key rather than fail on the first request
+        get_authkey()
+        if settings.MODEL_SERVER_AUTOSTART:
+            ensure_model_server()
+    elif settings.CLASSIFICATION_ENABLED and settings.MODEL_PRELOAD:
+        get_model_registry().start_background_load()
+    yield
+    stop_workers()
+    get_callback_dispatcher().close()
+    # Release the shared thread and process pools on shutdown
+    shutdown_executors()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Include API routers
 app.include_router(health_check.router, prefix="/api/v1")
 app.include_router(file_processing.router, prefix="/api/v1")
-app.include_router(classification.router, prefix="/api/v1")
+if settings.CLASSIFICATION_ENABLED:
+    # Imported only when enabled, so disabled deployments never load TensorFlow
+    from app.api.v1.endpoints import classification
+    app.include_router(classification.router, prefix="/api/v1")
 app.include_router(mri_colorization.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(volumes.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
 
 # Default route for checking if the application is up
 @app.get("/", dependencies=[Depends(api_key_authentication)])
@@ -0,0 +1,129 @@
+import numpy as np
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a request can't be queued because the batcher is at capacity."""
+
+
+class MicroBatcher:
+    """Coalesces inference requests from concurrent callers into shared forward passes.
+
+    Each request is a dict of per-plane arrays with a leading batch dimension.
+    A background thread collects requests until max_batch_size rows are queued
+    or max_wait_ms has passed since the first one arrived, runs a single
+    forward call on the concatenated batch and scatters the rows back to the
+    waiting callers. A request that would push a batch past max_batch_size
+    starts the next one instead; only a single request larger than the limit
+    runs over it, on its own.
+    """
+
+    def __init__(self, forward, max_batch_size: int = 16, max_wait_ms: float = 10,
+                 max_queue_depth: int = 64, name: str = "batcher"):
+        self.forward = forward
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._thread = None
+        self._held = None  # Request that didn't fit the previous batch, only touched by the batching thread
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "batches": 0,
+            "batched_rows": 0,
+            "max_batch_rows": 0,
+        }
+
+    def submit(self, inputs: dict) -> Future:
+        """Queue one request and return a future resolving to its per-plane outputs."""
+        self._ensure_started()
+        future = Future()
+        rows = len(next(iter(inputs.values())))
+        try:
+            self._queue.put_nowait((inputs, future, rows))
+        except queue.Full:
+            self._count("rejected")
+            raise QueueFullError(f"{self.name} queue is full ({self._queue.maxsize} pending requests)")
+        self._count("submitted")
+        return future
+
+    def predict(self, inputs: dict) -> dict:
+        """Submit a request and block until its results are available."""
+        return self.submit(inputs).result()
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["avg_batch_rows"] = stats["batched_rows"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            if self._held is not None:
+                batch, self._held = [self._held], None
+            else:
+                batch = [self._queue.get()]
+            rows = batch[0][2]
+            deadline = time.monotonic() + self.max_wait
+
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if rows + item[2] > self.max_batch_size:
+                    self._held = item
+                    break
+                batch.append(item)
+                rows += item[2]
+
+            self._dispatch(batch, rows)
+
+    def _dispatch(self, batch: list, rows: int):
+        try:
+            planes = batch[0][0].keys()
+            stacked = {plane: np.concatenate([inputs[plane] for inputs, _, _ in batch]) for plane in planes}
+            outputs = self.forward(stacked)
+        except Exception as e:
+            logger.error(f"{self.name} forward pass failed for {len(batch)} requests: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["batched_rows"] += rows
+            self._stats["max_batch_rows"] = max(self._stats["max_batch_rows"], rows)
+
+        offset = 0
+        for _, future, count in batch:
+            future.set_result({plane: output[offset:offset + count] for plane, output in outputs.items()})
+            offset += count
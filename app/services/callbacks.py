@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from pathlib import Path
+from urllib.parse import urlsplit
+import httpx
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram, DURATION_BUCKETS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying; any other 4xx is treated as a permanent rejection
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+CALLBACK_ATTEMPT_SECONDS = Histogram(
+    "vizmed_callback_attempt_seconds", "Duration of callback POST attempts", ["outcome"], buckets=DURATION_BUCKETS)
+CALLBACKS_TOTAL = Counter(
+    "vizmed_callbacks_total", "Callbacks by final outcome (delivered, dead or parked for replay)", ["outcome"])
+CALLBACKS_IN_FLIGHT = Gauge("vizmed_callbacks_in_flight", "Callbacks being delivered", multiprocess_mode="livesum")
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+class CallbackDispatcher:
+    """Delivers callback payloads over a shared keep-alive HTTP client.
+
+    Every payload is written to an on-disk outbox before it is sent and only
+    removed once the receiver accepts it, so undelivered callbacks survive
+    restarts and are replayed. Requests run on a private event loop thread,
+    which lets synchronous job code hand off a callback without blocking on it.
+    """
+
+    def __init__(self, outbox_dir, timeout: float = 10, max_attempts: int = 5, backoff: float = 1,
+                 max_connections: int = 100, max_connections_per_host: int = 10,
+                 replay_interval: float = 60):
+        self.outbox_dir = Path(outbox_dir)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.replay_interval = replay_interval
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._host_semaphores = {}
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the delivery loop and replay anything left in the outbox."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.outbox_dir.mkdir(parents=True, exist_ok=True)
+            (self.outbox_dir / "dead").mkdir(exist_ok=True)
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="callback-dispatcher", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._replay_periodically(), self._loop)
+
+    def close(self, timeout: float = 5):
+        if self._thread is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self._client = None
+
+    def dispatch(self, url: str, payload: dict):
+        """Persist a callback and schedule its delivery; returns a concurrent future.
+
+        The future resolves to True once delivered, or False if delivery was
+        given up for now (the payload then stays in the outbox for replay).
+        """
+        self.start()
+        entry = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "payload": payload,
+            "attempts": 0,
+            "created_at": time.time()
+        }
+        sending_path = self._sending_path(entry["id"])
+        self._write_entry(sending_path, entry)
+        return asyncio.run_coroutine_threadsafe(self._deliver(sending_path, entry), self._loop)
+
+    def replay_outbox(self):
+        """Claim and resend every pending entry, including stale in-flight ones."""
+        stale_before = time.time() - self.timeout * self.max_attempts * 4
+        for path in self.outbox_dir.glob("*.json"):
+            self._claim_and_send(path)
+        for path in self.outbox_dir.glob("*.sending"):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    self._claim_and_send(path)
+            except FileNotFoundError:
+                pass
+
+    def _sending_path(self, entry_id: str) -> Path:
+        return self.outbox_dir / f"{entry_id}.{uuid.uuid4().hex[:8]}.sending"
+
+    def _claim_and_send(self, path: Path):
+        entry_id = path.name.split(".")[0]
+        sending_path = self._sending_path(entry_id)
+        try:
+            # Renaming is atomic, so only one process picks up a given entry
+            os.rename(path, sending_path)
+            entry = json.loads(sending_path.read_text())
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logger.warning(f"Skipping unreadable outbox entry {path.name}: {e}")
+            return
+        logger.info(f"Replaying callback {entry['id']} to {entry['url']}")
+        asyncio.run_coroutine_threadsafe(self._deliver(sending_path, entry), self._loop)
+
+    @staticmethod
+    def _write_entry(path: Path, entry: dict):
+        partial = path.with_suffix(".partial")
+        partial.write_text(json.dumps(entry))
+        os.replace(partial, path)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_semaphores[host]
+
+    async def _deliver(self, sending_path: Path, entry: dict) -> bool:
+        with CALLBACKS_IN_FLIGHT.track_inprogress():
+            outcome = await self._deliver_attempts(sending_path, entry)
+        CALLBACKS_TOTAL.labels(outcome=outcome).inc()
+        return outcome == "delivered"
+
+    async def _deliver_attempts(self, sending_path: Path, entry: dict) -> str:
+        url = entry["url"]
+        while entry["attempts"] < self.max_attempts:
+            entry["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                async with self._host_semaphore(url):
+                    response = await self._get_client().post(url, json=entry["payload"])
+                CALLBACK_ATTEMPT_SECONDS.labels(outcome=str(response.status_code)).observe(
+                    time.perf_counter() - started)
+
+                if response.is_success:
+                    logger.info(f"Successfully sent callback {entry['id']} to {url}: {response.text}")
+                    sending_path.unlink(missing_ok=True)
+                    return "delivered"
+
+                logger.error(f"Callback {entry['id']} to {url} failed "
+                             f"(status: {response.status_code}): {response.text}")
+                if response.is_client_error and response.status_code not in RETRYABLE_STATUS_CODES:
+                    self._write_entry(self.outbox_dir / "dead" / f"{entry['id']}.json", entry)
+                    sending_path.unlink(missing_ok=True)
+                    return "dead"
+            except httpx.HTTPError as e:
+                CALLBACK_ATTEMPT_SECONDS.labels(outcome=type(e).__name__).observe(time.perf_counter() - started)
+                logger.error(f"Callback {entry['id']} to {url} raised {type(e).__name__}: {e}")
+
+            if entry["attempts"] < self.max_attempts:
+                await asyncio.sleep(self.backoff * 2 ** (entry["attempts"] - 1))
+
+        # Park it for the next replay instead of dropping the result
+        logger.error(f"Giving up on callback {entry['id']} for now, kept in outbox")
+        entry["attempts"] = 0
+        self._write_entry(self.outbox_dir / f"{entry['id']}.json", entry)
+        sending_path.unlink(missing_ok=True)
+        return "parked"
+
+    async def _replay_periodically(self):
+        while True:
+            try:
+                self.replay_outbox()
+            except Exception as e:
+                logger.error(f"Failed to replay callback outbox: {e}")
+            await asyncio.sleep(self.replay_interval)
+
+
+def get_callback_dispatcher() -> CallbackDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = CallbackDispatcher(
+                    settings.CALLBACK_OUTBOX_DIR,
+                    timeout=settings.CALLBACK_TIMEOUT_SECONDS,
+                    max_attempts=settings.CALLBACK_MAX_ATTEMPTS,
+                    backoff=settings.CALLBACK_RETRY_BACKOFF_SECONDS,
+                    max_connections=settings.CALLBACK_MAX_CONNECTIONS,
+                    max_connections_per_host=settings.CALLBACK_MAX_CONNECTIONS_PER_HOST,
+                    replay_interval=settings.CALLBACK_REPLAY_INTERVAL_SECONDS
+                )
+    return _dispatcher
+
+
+def dispatch_callback(url: str, payload: dict):
+    return get_callback_dispatcher().dispatch(url, payload)
@@ -1,56 +1,106 @@
-import nibabel as nib
+import os
 import numpy as np
 import cv2
-from tensorflow.keras.models import load_model
-from tensorflow.keras.utils import get_custom_objects
-import tensorflow_addons as tfa
 from app.core.config import settings
-from app.services.s3 import download_file_from_s3
-import os
+from app.core.metrics import time_stage, register_collector, CounterMetricFamily, GaugeMetricFamily
+from app.services.volume_services import load_volume, get_volume_data, extract_views, get_view_axes
+from app.services.model_registry import get_model_registry, PLANES, MODEL_INPUT_SHAPE
+from app.services.model_server import get_model_server_client
+from app.services.batching import MicroBatcher
+from app.services.volume_cache import get_volume_cache
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load models at the start to avoid reloading them for every request
-logger.info("Loading pretrained models...")
-get_custom_objects().update({'Addons>F1Score': tfa.metrics.F1Score})
 
-try:
-    axial_model = load_model(settings.AXIAL_MODEL_PATH)
-    logger.info("Axial model loaded successfully.")
+def forward_with_registry(batches: dict) -> dict:
+    if settings.MODEL_SERVER_ENABLED:
+        # The shared model server owns the models, this worker holds none
+        return get_model_server_client().predict(batches)
 
-    coronal_model = load_model(settings.CORONAL_MODEL_PATH)
-    logger.info("Coronal model loaded successfully.")
+    # Models load in the background after startup; requests that arrive
+    # first wait up to CLASSIFY_MODEL_WAIT_SECONDS before failing with 503
+    engine = get_model_registry().get_engine(timeout=settings.CLASSIFY_MODEL_WAIT_SECONDS)
+    return engine.predict(batches)
 
-    sagittal_model = load_model(settings.SAGITTAL_MODEL_PATH)
-    logger.info("Sagittal model loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load models: {e}")
-    raise e
 
+def forward_timed(batches: dict) -> dict:
+    # Includes the model server round trip, which per-plane timings in that process don't
+    with time_stage("classification_forward"):
+        return forward_with_registry(batches)
 
-def classify_mri_file(s3_key: str, bucket_name: str, local_file_path):
 
+# Coalesce concurrent requests into shared forward passes
+classification_batcher = MicroBatcher(
+    forward_timed,
+    max_batch_size=settings.CLASSIFY_BATCH_MAX_SIZE,
+    max_wait_ms=settings.CLASSIFY_BATCH_MAX_WAIT_MS,
+    max_queue_depth=settings.CLASSIFY_QUEUE_MAX_DEPTH,
+    name="classification-batcher"
+)
+
+
+def collect_batcher_metrics():
+    stats = classification_batcher.get_stats()
+    return [
+        GaugeMetricFamily("vizmed_classification_queue_depth",
+                          "Classification requests waiting for a forward pass", value=stats["queue_depth"]),
+        CounterMetricFamily("vizmed_classification_batches",
+                            "Forward passes run by the classification batcher", value=stats["batches"]),
+        CounterMetricFamily("vizmed_classification_batched_rows",
+                            "Slices classified by the classification batcher", value=stats["batched_rows"]),
+        CounterMetricFamily("vizmed_classification_rejected",
+                            "Classification requests rejected with a full queue", value=stats["rejected"]),
+    ]
+
+
+register_collector(collect_batcher_metrics)
+
+CLASS_LABELS = ['AD', 'CN', 'EMCI', 'LMCI', 'MCI']  # Assuming 5 classes
+
+# Volume intensities are mapped to [0, 1] between these percentiles, sampled on a coarse grid
+NORMALIZATION_PERCENTILES = (0.5, 99.5)
+NORMALIZATION_SAMPLE_STEP = 4
+# Voxels above this fraction of the intensity range count as brain for "brain_mask" sampling
+BRAIN_MASK_THRESHOLD = 0.1
+
+
+def classify_mri_file(s3_key: str, bucket_name: str, local_file_path):
     # Check if the file exists locally
-    if not os.path.isfile(local_file_path):
-        logger.info(f"File not found locally. Downloading from S3: {s3_key}")
-        download_file_from_s3(s3_key, bucket_name, local_file_path)
+    if local_file_path and os.path.isfile(local_file_path):
+        return classify_local_file(local_file_path)
 
-    logger.info(f"Classifying MRI file: {local_file_path}")
-    
-    # The rest of the code is unchanged, using local_file_path
-    axial_slice, coronal_slice, sagittal_slice = get_middle_slices(local_file_path)
+    # Otherwise read it through the shared volume cache, where it stays for
+    # /file-processing and later requests
+    logger.info(f"File not found locally. Fetching through the volume cache: {s3_key}")
+    with get_volume_cache().fetch(s3_key, bucket_name) as cached_path:
+        return classify_local_file(str(cached_path))
 
-    axial_input = preprocess_slice(axial_slice)
-    coronal_input = preprocess_slice(coronal_slice)
-    sagittal_input = preprocess_slice(sagittal_slice)
 
-    logger.info("Making predictions for axial, coronal, and sagittal slices.")
-    axial_prediction = axial_model.predict(axial_input)
-    coronal_prediction = coronal_model.predict(coronal_input)
-    sagittal_prediction = sagittal_model.predict(sagittal_input)
+def classify_local_file(local_file_path):
+    logger.info(f"Classifying MRI file: {local_file_path}")
+    
+    views, intensity_range, extents = load_views(local_file_path)
+    slices_per_plane = settings.CLASSIFY_SLICES_PER_PLANE
+    slices = get_sampled_slices(views, extents, slices_per_plane)
+
+    # One (3K, 128, 128, 3) batch for all planes, each plane's rows a view into it
+    with time_stage("classification_preprocess"):
+        batch = preprocess_slices(slices, intensity_range)
+
+    logger.info(f"Making predictions for {slices_per_plane} slice(s) per plane.")
+    slice_predictions = classification_batcher.predict({
+        plane: batch[i * slices_per_plane:(i + 1) * slices_per_plane] for i, plane in enumerate(PLANES)
+    })
+    predictions = {
+        plane: aggregate_predictions(slice_predictions[plane], settings.CLASSIFY_AGGREGATION)
+        for plane in PLANES
+    }
+    axial_prediction = predictions["axial"]
+    coronal_prediction = predictions["coronal"]
+    sagittal_prediction = predictions["sagittal"]
 
     # Get class labels as strings
     axial_class_label = get_class_label(axial_prediction)
@@ -64,7 +114,16 @@ def classify_mri_file(s3_key: str, bucket_name: str, local_file_path):
         "axial_classification": axial_class_label,
         "coronal_classification": coronal_class_label,
         "sagittal_classification": sagittal_class_label,
-        "ensemble_prediction": ensemble_result
+        "ensemble_prediction": ensemble_result,
+        "probabilities": {
+            plane: get_class_probabilities(prediction)
+            for plane, prediction in predictions.items()
+        },
+        "confidence": {
+            plane: float(np.max(prediction))
+            for plane, prediction in predictions.items()
+        },
+        "slices_per_plane": slices_per_plane
     }
 
     logger.info(f"Prediction result: {result}")
@@ -72,62 +131,126 @@ def classify_mri_file(s3_key: str, bucket_name: str, local_file_path):
     return result
 
 
-def rescale_slice(slice_data):
-    logger.info("Rescaling slice data to [0, 1] range.")
-    slice_data = slice_data.astype(np.float32)
-    slice_data = slice_data / 255.0
-    return slice_data
-
-
-def determine_axes(affine):
-    logger.info("Determining the axes for slice extraction.")
-    orientation = nib.aff2axcodes(affine)
-    plane_to_axis = {'R': None, 'A': None, 'S': None}
-    for idx, axis in enumerate(orientation):
-        if axis in ('R', 'L'):
-            plane_to_axis['R'] = idx  # Sagittal
-        elif axis in ('A', 'P'):
-            plane_to_axis['A'] = idx  # Coronal
-        elif axis in ('S', 'I'):
-            plane_to_axis['S'] = idx  # Axial
-    logger.info(f"Axes determined: {plane_to_axis}")
-    return plane_to_axis
-
-
-def get_middle_slices(nii_file_path):
+def load_views(nii_file_path):
+    """Open a volume memory-mapped and return its plane views, normalization range
+    and the brain extent (start, stop) along each plane."""
     logger.info(f"Loading MRI file: {nii_file_path}")
-    nii_image = nib.load(nii_file_path)
-    nii_data = nii_image.get_fdata()
-
-    affine = nii_image.affine
-    plane_to_axis = determine_axes(affine)
-
+    nii_image = load_volume(nii_file_path)
+    volume = get_volume_data(nii_image)
+    step = NORMALIZATION_SAMPLE_STEP
+    sample = np.asarray(volume[::step, ::step, ::step], dtype=np.float32)
+
+    views = extract_views(volume, nii_image.affine)
+    intensity_range = get_intensity_range(sample)
+    extents = get_brain_extents(sample, step, intensity_range, get_view_axes(nii_image.affine), views)
+    return views, intensity_range, extents
+
+
+def get_intensity_range(sample):
+    """Robust (low, high) intensity of the whole volume, estimated from a strided sample."""
+    low, high = np.percentile(sample, NORMALIZATION_PERCENTILES)
+    if high <= low:
+        high = low + 1  # Constant volumes normalize to zeros instead of NaN
+    return float(low), float(high)
+
+
+def get_brain_extents(sample, step, intensity_range, view_axes, views):
+    """First and last slice of each plane containing tissue, from the strided sample."""
+    low, high = intensity_range
+    mask = sample > low + BRAIN_MASK_THRESHOLD * (high - low)
+    if mask.ndim > 3:
+        mask = mask.any(axis=tuple(range(3, mask.ndim)))
+
+    extents = {}
+    for plane in PLANES:
+        axis = view_axes[plane]
+        count = len(views[plane])
+        present = np.flatnonzero(mask.any(axis=tuple(a for a in range(3) if a != axis)))
+        if len(present) == 0:
+            extents[plane] = (0, count)
+        else:
+            extents[plane] = (int(present[0]) * step, min(count, (int(present[-1]) + 1) * step))
+    return extents
+
+
+def sample_slice_indices(count: int, slices: int, extent: tuple = None, span: float = None) -> np.ndarray:
+    """Indices of `slices` slices spread over `span` of the range around its center.
+
+    The range is the whole plane, or the brain extent when one is given.
+    Without an extent a single slice is the exact middle of the plane, as before.
+    """
+    if slices == 1 and extent is None:
+        return np.array([count // 2])
+    span = settings.CLASSIFY_SLICE_SPAN if span is None else span
+    start, stop = extent if extent is not None else (0, count)
+    center = (start + stop - 1) / 2
+    half_width = span * (stop - start) / 2
+    indices = np.linspace(center - half_width, center + half_width, slices)
+    return np.clip(np.rint(indices), 0, count - 1).astype(int)
+
+
+def get_sampled_slices(views, extents, slices_per_plane: int):
+    """K slices per plane, plane after plane, read from the memory-mapped views."""
+    use_mask = settings.CLASSIFY_SLICE_SAMPLING == "brain_mask"
     logger.info(
-        "Extracting middle slices from axial, coronal, and sagittal planes.")
-    mid_axial = nii_data.shape[plane_to_axis['S']] // 2
-    mid_coronal = nii_data.shape[plane_to_axis['A']] // 2
-    mid_sagittal = nii_data.shape[plane_to_axis['R']] // 2
-
-    axial_slice = np.take(nii_data, mid_axial, axis=plane_to_axis['S'])
-    coronal_slice = np.take(nii_data, mid_coronal, axis=plane_to_axis['A'])
-    sagittal_slice = np.take(nii_data, mid_sagittal, axis=plane_to_axis['R'])
-
-    return axial_slice, coronal_slice, sagittal_slice
-
-
-def preprocess_slice(slice_data):
-    logger.info("Preprocessing MRI slice for model input.")
-    slice_data = rescale_slice(slice_data)
-    slice_data_resized = cv2.resize(slice_data, (128, 128))
-    slice_data_rgb = np.stack([slice_data_resized] * 3, axis=-1)
-    slice_data_rgb = np.expand_dims(slice_data_rgb, axis=0)
-    return slice_data_rgb
+        f"Extracting {slices_per_plane} slice(s) from axial, coronal, and sagittal planes.")
+    slices = []
+    for plane in PLANES:
+        indices = sample_slice_indices(
+            len(views[plane]), slices_per_plane, extents[plane] if use_mask else None)
+        # Only the sampled slices are read from the memory-mapped volume
+        slices.extend(np.asarray(views[plane][int(i)]) for i in indices)
+    return slices
+
+
+def aggregate_predictions(predictions: np.ndarray, method: str = "mean") -> np.ndarray:
+    """Combine the (K, classes) probabilities of one plane into a (1, classes) prediction.
+
+    "weighted" votes with each slice's confidence (its top probability), so
+    ambiguous slices count less than clear ones.
+    """
+    if method == "weighted":
+        weights = predictions.max(axis=1, keepdims=True)
+        combined = (weights * predictions).sum(axis=0) / weights.sum()
+    else:
+        combined = predictions.mean(axis=0)
+    return combined[np.newaxis]
+
+
+def get_classification_config_key() -> str:
+    """Settings that change classification output, for keying cached results."""
+    return (f"k{settings.CLASSIFY_SLICES_PER_PLANE}:{settings.CLASSIFY_SLICE_SAMPLING}:"
+            f"{settings.CLASSIFY_SLICE_SPAN}:{settings.CLASSIFY_AGGREGATION}")
+
+
+def preprocess_slices(slices, intensity_range, out=None):
+    """Resize and normalize slices into one (N, 128, 128, 3) float32 model batch.
+
+    Slices are resized straight into a preallocated (N, 128, 128) buffer and
+    normalized in place with the volume's intensity range. The three color
+    channels are a broadcast view of that buffer, so the gray data is never
+    copied; the batcher materializes it once when it concatenates requests.
+    """
+    height, width, channels = MODEL_INPUT_SHAPE
+    if out is None:
+        out = np.empty((len(slices), height, width), dtype=np.float32)
+    for i, slice_data in enumerate(slices):
+        cv2.resize(np.asarray(slice_data, dtype=np.float32), (width, height), dst=out[i])
+
+    low, high = intensity_range
+    out -= low
+    out *= 1.0 / (high - low)
+    np.clip(out, 0.0, 1.0, out=out)
+    return np.broadcast_to(out[..., np.newaxis], (len(slices), height, width, channels))
 
 
 def get_class_label(prediction):
     logger.info("Mapping prediction to class label.")
-    class_labels = ['AD', 'CN', 'EMCI', 'LMCI', 'MCI']  # Assuming 5 classes
-    return class_labels[np.argmax(prediction)]
+    return CLASS_LABELS[np.argmax(prediction)]
+
+
+def get_class_probabilities(prediction):
+    return {label: float(p) for label, p in zip(CLASS_LABELS, np.ravel(prediction))}
 
 
 def ensemble_predictions(axial_pred, coronal_pred, sagittal_pred):
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+import multiprocessing
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.core.config import settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_io_executor = None
+_cpu_executor = None
+_executor_lock = threading.Lock()
+_endpoint_semaphores = {}
+
+
+class EndpointBusyError(Exception):
+    """Raised when an endpoint already runs as many requests as it is allowed to."""
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Shared bounded thread pool for I/O and GIL-releasing work (S3, TF, encoders)."""
+    global _io_executor
+    if _io_executor is None:
+        with _executor_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=settings.IO_POOL_WORKERS, thread_name_prefix="io-worker")
+                logger.info(f"Started I/O thread pool with {settings.IO_POOL_WORKERS} workers")
+    return _io_executor
+
+
+def get_cpu_executor() -> ProcessPoolExecutor:
+    """Shared process pool for CPU-bound NumPy/cv2 work that holds the GIL."""
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _executor_lock:
+            if _cpu_executor is None:
+                # Spawned rather than forked: the parent may have TF/BLAS threads running
+                _cpu_executor = ProcessPoolExecutor(
+                    max_workers=settings.CPU_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Started CPU process pool with {settings.CPU_POOL_WORKERS} workers")
+    return _cpu_executor
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking call on the I/O thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Run a picklable CPU-bound call on the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
+
+
+def endpoint_limit(name: str) -> asyncio.Semaphore:
+    """Semaphore capping how many requests of one endpoint run blocking work at once."""
+    if name not in _endpoint_semaphores:
+        limits = {
+            "classify": settings.CLASSIFY_CONCURRENCY,
+            "colorize": settings.COLORIZE_CONCURRENCY,
+        }
+        _endpoint_semaphores[name] = asyncio.Semaphore(limits.get(name, settings.IO_POOL_WORKERS))
+    return _endpoint_semaphores[name]
+
+
+@asynccontextmanager
+async def endpoint_slot(name: str):
+    """Take one of the endpoint's slots, or fail with EndpointBusyError instead of waiting.
+
+    Waiting would let callers pile up without bound behind the semaphore.
+    """
+    semaphore = endpoint_limit(name)
+    if semaphore.locked():
+        raise EndpointBusyError(f"Too many concurrent {name} requests")
+    async with semaphore:
+        yield
+
+
+def shutdown_executors():
+    global _io_executor, _cpu_executor
+    with _executor_lock:
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(wait=False, cancel_futures=True)
+            _cpu_executor = None
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=False, cancel_futures=True)
+            _io_executor = None
+    logger.info("Executors shut down")
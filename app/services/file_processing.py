@@ -1,61 +1,71 @@
 import os
+import io
+import json
+import functools
 import logging
-import nibabel as nib
+import time
 import numpy as np
 from PIL import Image
-from zipfile import ZipFile
-from app.services.s3 import upload_file_to_s3
+from zipfile import ZipFile, ZIP_STORED
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.metrics import STAGE_SECONDS, time_stage
+from app.services.s3 import upload_file_to_s3, upload_bytes_to_s3, upload_many_to_s3, S3MultipartWriter
 from fastapi import HTTPException, status
 from app.services.common_services import create_temp_directory,delete_temp_directory
-import shutil
-from pathlib import Path
+from app.services.volume_services import load_volume, get_volume_data, extract_views, get_view_axes
+from app.services.executors import get_io_executor, get_cpu_executor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Output format name -> (PIL format, file extension, pixel dtype, content type)
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "jpg", np.uint8, "image/jpeg"),
+    "webp": ("WEBP", "webp", np.uint8, "image/webp"),
+    "png16": ("PNG", "png", np.uint16, "image/png"),
+}
 
-def process_nii_file(file_path: str, s3_key: str, bucket_name: str):
+
+def process_nii_file(file_path: str, s3_key: str, bucket_name: str, output_mode: str = "zip"):
     try:
         logger.info(f"Processing NIfTI file: {file_path}")
-        nii_img = nib.load(file_path)
-        nii_data = nii_img.get_fdata()
+        nii_img = load_volume(file_path)
+        nii_data = get_volume_data(nii_img)
 
         # Extract slices and organize them in Axial, Sagittal, Coronal views
-        views = {
-            "axial": nii_data[:, :, :],
-            "sagittal": nii_data[:, :, :],
-            "coronal": nii_data[:, :, :]
-        }
-
-        base_dir = create_temp_directory(s3_key)
-
-        metadata = {}
-        for view, slices in views.items():
-            view_dir = base_dir / view
-            view_dir.mkdir(parents=True, exist_ok=True)
-            logger.info(f"Saving {view} slices locally at: {view_dir}")
+        views = extract_views(nii_data, nii_img.affine)
 
-            slice_count = save_slices_locally(slices, view_dir, view)
-            if slice_count > 0:
-                metadata[view] = {
-                    "num_slices": slice_count,
-                    "folder_key": f"{os.path.dirname(s3_key)}/{view}/"
-                }
+        executor = get_slice_encoder_pool()
 
-        # Zip the entire base directory (with subfolders for views)
-        zip_file_path = base_dir / \
-            f"{os.path.basename(os.path.dirname(s3_key))}_mri_slices.zip"
-        zip_slices(base_dir, zip_file_path)
+        if output_mode == "objects":
+            metadata, manifest_key = publish_slice_objects(views, nii_img, s3_key, bucket_name, executor)
+            return {
+                "zip_file_key": None,
+                "manifest_key": manifest_key,
+                "metadata": metadata
+            }
 
-        # Upload the zip file to S3
         s3_zip_key = f"{os.path.dirname(s3_key)}/mri_slices.zip"
-        upload_file_to_s3(str(zip_file_path), s3_zip_key, bucket_name)
 
-        zip_file_path.unlink()  # Remove the zip file
+        if settings.SLICE_ARCHIVE_STREAM_TO_S3:
+            # Stream the archive straight into a multipart upload
+            with S3MultipartWriter(s3_zip_key, bucket_name) as s3_stream:
+                metadata = write_slices_archive(views, s3_stream, s3_key, executor)
+        else:
+            base_dir = create_temp_directory(s3_key)
+            zip_file_path = base_dir / \
+                f"{os.path.basename(os.path.dirname(s3_key))}_mri_slices.zip"
+            try:
+                with open(zip_file_path, "wb") as zip_file:
+                    metadata = write_slices_archive(views, zip_file, s3_key, executor)
 
-        # Clean up the local files
-        delete_temp_directory(base_dir)  # Remove the patient-specific temp directory
+                # Upload the zip file to S3
+                upload_file_to_s3(str(zip_file_path), s3_zip_key, bucket_name)
+            finally:
+                # Clean up the local files
+                delete_temp_directory(base_dir)  # Remove the patient-specific temp directory
 
         data = {
             "zip_file_key": s3_zip_key,  # Add the zip file key
@@ -72,38 +82,258 @@ def process_nii_file(file_path: str, s3_key: str, bucket_name: str):
         )
 
 
-def save_slices_locally(slices, save_dir, prefix):
-    slice_count = 0
-    for i, slice in enumerate(slices):
-        try:
-            # Normalize slice data to range 0-255 for image saving
-            slice_normalized = (slice - np.min(slice)) / \
-                (np.max(slice) - np.min(slice)) * 255
-            slice_normalized = slice_normalized.astype(np.uint8)
+def write_slices_archive(views, fileobj, s3_key, executor):
+    """Encode every view into a zip written to fileobj and return the view metadata.
+
+    Encoded bytes go from memory straight into the archive, stored
+    uncompressed since JPEG/WebP/PNG data doesn't shrink any further.
+    """
+    metadata = {}
+    with ZipFile(fileobj, 'w', compression=ZIP_STORED) as zipf:
+        for view, slices in views.items():
+            logger.info(f"Encoding {view} slices into archive")
+
+            slice_count = 0
+            for level, file_name, encoded in render_slices(slices, view, executor):
+                with time_stage("zip_write"):
+                    zipf.writestr(f"{view}/{file_name}", encoded)
+                if level == 1:
+                    slice_count += 1
+
+            if slice_count > 0:
+                metadata[view] = {
+                    "num_slices": slice_count,
+                    "folder_key": f"{os.path.dirname(s3_key)}/{view}/",
+                    **get_rendition_metadata()
+                }
+    return metadata
+
+
+class _ChunkSink:
+    """Non-seekable file object collecting written bytes until they are drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip_stream(entries):
+    """Yield a stored zip archive of (name, bytes) entries chunk by chunk.
+
+    Nothing is buffered beyond the current entry, so a response can start
+    before the last entry has been produced.
+    """
+    sink = _ChunkSink()
+    with ZipFile(sink, 'w', compression=ZIP_STORED) as zipf:
+        for name, data in entries:
+            with time_stage("zip_write"):
+                zipf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def publish_slice_objects(views, nii_img, s3_key, bucket_name, executor):
+    """Upload every slice as its own object plus a JSON manifest describing them.
+
+    Slices land under <dir>/<view>/ with the same names used inside the zip,
+    so a viewer can fetch individual slices lazily instead of the archive.
+    Returns the view metadata and the manifest key.
+    """
+    folder = os.path.dirname(s3_key)
+    zooms = [float(zoom) for zoom in nii_img.header.get_zooms()[:3]]
+    view_axes = get_view_axes(nii_img.affine)
+    _, extension, _, content_type = IMAGE_FORMATS[settings.SLICE_IMAGE_FORMAT]
+
+    metadata = {}
+    manifest_views = {}
+    for view, slices in views.items():
+        logger.info(f"Publishing {view} slices as individual objects")
+        ranges = np.empty((len(slices), 2), dtype=np.float64)
+        rendered = list(render_slices(slices, view, executor, ranges=ranges))
+        slice_count = sum(1 for level, _, _ in rendered if level == 1)
+        if slice_count == 0:
+            continue
+        upload_many_to_s3(
+            [(encoded, f"{folder}/{view}/{file_name}") for _, file_name, encoded in rendered],
+            bucket_name,
+            content_type=content_type
+        )
+
+        metadata[view] = {
+            "num_slices": slice_count,
+            "folder_key": f"{folder}/{view}/",
+            **get_rendition_metadata()
+        }
+        in_plane_spacing = [zoom for axis, zoom in enumerate(zooms) if axis != view_axes[view]]
+        slice_shape = [int(size) for size in slices.shape[1:3]]
+        manifest_views[view] = {
+            **metadata[view],
+            "file_pattern": f"{view}slice{{index}}.{extension}",
+            "slice_shape": slice_shape,
+            "pixel_spacing": in_plane_spacing,
+            "slice_spacing": zooms[view_axes[view]],
+            "pyramid": {
+                str(level): {
+                    "folder_key": f"{folder}/{view}/{get_level_dir(level)}",
+                    "slice_shape": [size // level for size in slice_shape],
+                    "pixel_spacing": [spacing * level for spacing in in_plane_spacing]
+                }
+                for level in get_pyramid_levels()
+            },
+            # Each slice is min-max normalized on its own; these map 0-max back to intensities
+            "slice_windows": ranges.tolist()
+        }
+
+    all_ranges = [window for view in manifest_views.values() for window in view["slice_windows"]]
+    manifest = {
+        "version": 1,
+        "source_key": s3_key,
+        "dimensions": [int(size) for size in nii_img.shape[:3]],
+        "voxel_spacing": zooms,
+        "intensity_window": {
+            "min": min((low for low, _ in all_ranges), default=0.0),
+            "max": max((high for _, high in all_ranges), default=0.0),
+            "normalization": "per-slice min-max"
+        },
+        "views": manifest_views
+    }
+
+    manifest_key = f"{folder}/manifest.json"
+    upload_bytes_to_s3(json.dumps(manifest).encode(), manifest_key, bucket_name, content_type="application/json")
+    logger.info(f"Uploaded slice manifest: {manifest_key}")
+    return metadata, manifest_key
+
+
+def get_rendition_metadata():
+    return {
+        "image_format": settings.SLICE_IMAGE_FORMAT,
+        "pyramid_levels": get_pyramid_levels()
+    }
+
+
+def get_pyramid_levels():
+    # Full resolution is always rendered, extra levels are integer downsample factors
+    levels = (int(level) for level in settings.SLICE_PYRAMID_LEVELS.split(",") if level.strip())
+    return sorted({1, *levels})
+
+
+def get_level_dir(level):
+    return "" if level == 1 else f"down{level}/"
+
+
+def get_slice_encoder_pool():
+    """Return the shared executor used to encode slices, as configured in settings."""
+    if settings.SLICE_ENCODER_POOL == "process":
+        return get_cpu_executor()
+    return get_io_executor()
+
 
-            # Convert to image and save locally
-            img = Image.fromarray(slice_normalized)
-            local_file_path = save_dir / f"{prefix}slice{i}.jpg"
-            img.save(local_file_path)
-            logger.info(f"Saved slice {i} locally at: {local_file_path}")
-            slice_count += 1
-        except Exception as e:
-            logger.error(f"Error processing slice {i}: {str(e)}")
+def normalize_slices(slices, out=None, chunk_size=None, ranges=None, dtype=np.uint8):
+    """Scale each slice along axis 0 to the full range of dtype into a preallocated buffer.
 
-    return slice_count
+    If ranges is given (an (N, 2) array) it receives each slice's original
+    min and max intensity.
+    """
+    chunk_size = chunk_size or settings.SLICE_NORMALIZE_CHUNK
+    if out is None:
+        out = np.empty(slices.shape, dtype=dtype)
+    scale = np.iinfo(out.dtype).max
 
+    for start in range(0, slices.shape[0], chunk_size):
+        block = np.array(slices[start:start + chunk_size], dtype=np.float32)
+        axes = tuple(range(1, block.ndim))
 
-def zip_slices(folder_path, zip_file_path):
+        # Per-slice min/max for the whole chunk at once
+        low = block.min(axis=axes, keepdims=True)
+        span = block.max(axis=axes, keepdims=True) - low
+        if ranges is not None:
+            ranges[start:start + len(block), 0] = low.ravel()
+            ranges[start:start + len(block), 1] = (low + span).ravel()
+        span[span == 0] = 1  # Constant slices become black instead of NaN
+
+        block -= low
+        block *= scale
+        block /= span
+        np.copyto(out[start:start + len(block)], block, casting="unsafe")
+
+    return out
+
+
+def downsample_slices(slices, factor):
+    """Box-filter a whole (N, H, W) stack by an integer factor in one vectorized pass."""
+    count, height, width = slices.shape
+    height, width = height // factor, width // factor
+    if height == 0 or width == 0:
+        return None
+    blocks = slices[:, :height * factor, :width * factor].reshape(count, height, factor, width, factor)
+    downsampled = blocks.mean(axis=(2, 4), dtype=np.float32)
+    return np.rint(downsampled, out=downsampled).astype(slices.dtype)
+
+
+def encode_slice(slice_normalized, image_format="JPEG", quality=None):
+    try:
+        buffer = io.BytesIO()
+        options = {"quality": quality} if quality is not None and image_format != "PNG" else {}
+        Image.fromarray(slice_normalized).save(buffer, format=image_format, **options)
+        return buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Error encoding slice: {str(e)}")
+        return None
+
+
+def encode_slice_timed(slice_normalized, image_format="JPEG", quality=None):
+    """encode_slice plus its duration, measured where it runs so process pools report it too."""
+    started = time.perf_counter()
+    encoded = encode_slice(slice_normalized, image_format, quality)
+    return encoded, time.perf_counter() - started
+
+
+def render_slices(slices, prefix, executor, ranges=None):
+    """Yield (pyramid level, file name, encoded bytes) for every slice of a view.
+
+    Full resolution slices come first, in slice order, followed by each
+    configured downsampled level under its own down<N>/ prefix.
+    """
+    image_format, extension, dtype, _ = IMAGE_FORMATS[settings.SLICE_IMAGE_FORMAT]
     try:
-        logger.info(f"Zipping folder: {folder_path}")
-        with ZipFile(zip_file_path, 'w') as zipf:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = Path(root) / file
-                    arcname = file_path.relative_to(
-                        folder_path)  # Relative path in zip
-                    zipf.write(file_path, arcname)
-        logger.info(f"Zipped folder into: {zip_file_path}")
+        with time_stage("slice_normalize"):
+            slices_normalized = normalize_slices(slices, ranges=ranges, dtype=dtype)
     except Exception as e:
-        logger.error(f"Error zipping folder {folder_path}: {str(e)}")
-        raise e
+        logger.error(f"Error normalizing {prefix} slices: {str(e)}")
+        return
+
+    encode = functools.partial(encode_slice_timed, image_format=image_format, quality=settings.SLICE_IMAGE_QUALITY)
+    encode_seconds = STAGE_SECONDS.labels(stage="slice_encode")
+    log_every = max(1, settings.SLICE_LOG_SAMPLE_EVERY)
+    # Larger chunks amortize pickling when the pool is process based
+    chunksize = 1 if isinstance(executor, ThreadPoolExecutor) else 16
+
+    for level in get_pyramid_levels():
+        stack = slices_normalized if level == 1 else downsample_slices(slices_normalized, level)
+        if stack is None:
+            logger.warning(f"Skipping pyramid level {level} for {prefix}, slices are too small")
+            continue
+
+        encoded_slices = executor.map(encode, stack, chunksize=chunksize)
+        for i, (encoded, seconds) in enumerate(encoded_slices):
+            encode_seconds.observe(seconds)
+            if encoded is None:
+                logger.error(f"Skipping {prefix} slice {i} (level {level})")
+                continue
+            if i % log_every == 0:
+                logger.debug(f"Encoded {prefix} slice {i} (level {level})")
+            yield level, f"{get_level_dir(level)}{prefix}slice{i}.{extension}", encoded
@@ -0,0 +1,402 @@
+import fcntl
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import logging
+from pathlib import Path
+from app.core.config import settings
+from app.core.metrics import Gauge, Histogram, DURATION_BUCKETS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    handler TEXT NOT NULL,
+    dedup_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    run_after REAL NOT NULL,
+    lease_expires_at REAL,
+    lease_token TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_run_after ON jobs (status, run_after);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedup_key
+    ON jobs (dedup_key) WHERE status IN ('queued', 'running');
+"""
+
+JOBS_IN_PROGRESS = Gauge("vizmed_jobs_in_progress", "Jobs currently running", ["handler"],
+                         multiprocess_mode="livesum")
+JOB_SECONDS = Histogram("vizmed_job_duration_seconds", "Duration of job attempts", ["handler", "outcome"],
+                        buckets=DURATION_BUCKETS)
+
+
+class JobLeaseLostError(Exception):
+    """The running job's lease expired and another worker may have claimed it."""
+
+
+# Job currently executed by this worker thread, used by report_progress
+_current_job = threading.local()
+_workers = []
+_stop_event = None
+_pool_lock_file = None
+
+
+def get_connection() -> sqlite3.Connection:
+    db_path = Path(settings.JOBS_DB_PATH)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "lease_token" not in columns:  # Databases created before leases were tokenized
+        try:
+            conn.execute("ALTER TABLE jobs ADD COLUMN lease_token TEXT")
+        except sqlite3.OperationalError:
+            pass  # Another process added it first
+    return conn
+
+
+def _row_to_job(row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue_job(handler: str, payload: dict, dedup_key: str = None) -> tuple:
+    """Persist a new job and return (job, created).
+
+    handler is a "module:function" path called with the payload as keyword
+    arguments. If a queued or running job already has the same dedup_key,
+    that job is returned instead and created is False.
+    """
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    conn = get_connection()
+    try:
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, handler, dedup_key, payload, status, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, handler, dedup_key, json.dumps(payload), JOB_QUEUED,
+                 settings.JOB_MAX_ATTEMPTS, now, now, now)
+            )
+        except sqlite3.IntegrityError:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND status IN (?, ?)",
+                (dedup_key, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+            if row is not None:
+                logger.info(f"Job with dedup key {dedup_key} already active: {row['id']}")
+                return _row_to_job(row), False
+            raise
+
+        logger.info(f"Enqueued job {job_id} ({handler})")
+        return get_job(job_id, conn), True
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str, conn: sqlite3.Connection = None):
+    owns_connection = conn is None
+    conn = conn or get_connection()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        if owns_connection:
+            conn.close()
+
+
+def claim_job(conn: sqlite3.Connection):
+    """Atomically take the next runnable job, including ones whose lease expired."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs abandoned by a dead worker after their last attempt are given up on
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'Worker lease expired', updated_at = ? "
+            "WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts",
+            (JOB_FAILED, now, JOB_RUNNING, now)
+        )
+        row = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_expires_at < ?) "
+            "ORDER BY run_after LIMIT 1",
+            (JOB_QUEUED, now, JOB_RUNNING, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        # Identifies this claim: writes from a worker whose lease was taken over match nothing
+        lease_token = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{row['attempts'] + 1}"
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, lease_token = ?, updated_at = ? "
+            "WHERE id = ?",
+            (JOB_RUNNING, now + settings.JOB_LEASE_SECONDS, lease_token, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return get_job(row["id"], conn)
+
+
+def complete_job(conn: sqlite3.Connection, job: dict, result) -> bool:
+    """Store the result; False if the job's lease was lost and nothing was written."""
+    cursor = conn.execute(
+        "UPDATE jobs SET status = ?, progress = 1, result = ?, error = NULL, lease_expires_at = NULL, "
+        "lease_token = NULL, updated_at = ? WHERE id = ? AND lease_token = ?",
+        (JOB_SUCCEEDED, json.dumps(result), time.time(), job["id"], job["lease_token"])
+    )
+    return cursor.rowcount == 1
+
+
+def fail_job(conn: sqlite3.Connection, job: dict, error: str) -> bool:
+    """Schedule a retry with exponential backoff, or mark the job failed for good.
+
+    Returns False if the job's lease was lost and nothing was written.
+    """
+    now = time.time()
+    if job["attempts"] < job["max_attempts"]:
+        delay = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, run_after = ?, lease_expires_at = NULL, lease_token = NULL, "
+            "updated_at = ? WHERE id = ? AND lease_token = ?",
+            (JOB_QUEUED, error, now + delay, now, job["id"], job["lease_token"])
+        )
+        if cursor.rowcount == 1:
+            logger.warning(f"Job {job['id']} failed (attempt {job['attempts']}), retrying in {delay}s")
+    else:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, lease_token = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_token = ?",
+            (JOB_FAILED, error, now, job["id"], job["lease_token"])
+        )
+        if cursor.rowcount == 1:
+            logger.error(f"Job {job['id']} failed after {job['attempts']} attempts")
+    return cursor.rowcount == 1
+
+
+def renew_lease(conn: sqlite3.Connection, job_id: str, lease_token: str, progress: float = None,
+                stage: str = None) -> bool:
+    """Extend the lease (and record progress); False if another worker holds the job now."""
+    now = time.time()
+    cursor = conn.execute(
+        "UPDATE jobs SET progress = COALESCE(?, progress), stage = COALESCE(?, stage), lease_expires_at = ?, "
+        "updated_at = ? WHERE id = ? AND lease_token = ?",
+        (progress, stage, now + settings.JOB_LEASE_SECONDS, now, job_id, lease_token)
+    )
+    return cursor.rowcount == 1
+
+
+class LeaseHeartbeat:
+    """Renews a running job's lease from a background thread, whatever the handler does."""
+
+    def __init__(self, job: dict):
+        self.job_id = job["id"]
+        self.lease_token = job["lease_token"]
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{self.job_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        interval = settings.JOB_LEASE_SECONDS / 3
+        conn = get_connection()
+        try:
+            while not self._stop.wait(interval):
+                try:
+                    if not renew_lease(conn, self.job_id, self.lease_token):
+                        logger.warning(f"Lost the lease on job {self.job_id}")
+                        self.lost.set()
+                        return
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to renew the lease on job {self.job_id}: {e}")
+        finally:
+            conn.close()
+
+
+def report_progress(progress: float, stage: str = None):
+    """Record progress for the job running on this thread; a no-op outside job workers.
+
+    Raises JobLeaseLostError once another worker has taken the job over, so
+    handlers stop before producing side effects (like callbacks) twice.
+    """
+    heartbeat = getattr(_current_job, "heartbeat", None)
+    if heartbeat is None:
+        return
+    if heartbeat.lost.is_set():
+        raise JobLeaseLostError(f"Job {heartbeat.job_id} was taken over by another worker")
+    conn = get_connection()
+    try:
+        renewed = renew_lease(conn, heartbeat.job_id, heartbeat.lease_token, progress, stage)
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to record progress for job {heartbeat.job_id}: {e}")
+        return
+    finally:
+        conn.close()
+    if not renewed:
+        heartbeat.lost.set()
+        raise JobLeaseLostError(f"Job {heartbeat.job_id} was taken over by another worker")
+
+
+def resolve_handler(handler: str):
+    module_name, function_name = handler.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_job(conn: sqlite3.Connection, job: dict):
+    heartbeat = LeaseHeartbeat(job)
+    heartbeat.start()
+    _current_job.heartbeat = heartbeat
+    in_progress = JOBS_IN_PROGRESS.labels(handler=job["handler"])
+    in_progress.inc()
+    started = time.perf_counter()
+    outcome = "failed"
+    try:
+        logger.info(f"Running job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        result = resolve_handler(job["handler"])(**job["payload"])
+        if complete_job(conn, job, result):
+            outcome = "succeeded"
+            logger.info(f"Job {job['id']} succeeded")
+        else:
+            outcome = "lease_lost"
+            logger.warning(f"Job {job['id']} finished after its lease was lost, dropping the result")
+    except JobLeaseLostError as e:
+        outcome = "lease_lost"
+        logger.warning(f"Abandoned job {job['id']}: {e}")
+    except Exception as e:
+        logger.error(f"Job {job['id']} raised: {e}\n{traceback.format_exc()}")
+        if not fail_job(conn, job, str(e)):
+            outcome = "lease_lost"
+            logger.warning(f"Job {job['id']} failed after its lease was lost, dropping the error")
+    finally:
+        _current_job.heartbeat = None
+        heartbeat.stop()
+        in_progress.dec()
+        JOB_SECONDS.labels(handler=job["handler"], outcome=outcome).observe(time.perf_counter() - started)
+
+
+def worker_loop(stop_event):
+    conn = get_connection()
+    parent = multiprocessing.parent_process()
+    try:
+        while not stop_event.is_set():
+            if parent is not None and not parent.is_alive():
+                logger.warning("Web process exited, stopping job worker")
+                break
+            try:
+                job = claim_job(conn)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                stop_event.wait(settings.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            run_job(conn, job)
+    finally:
+        conn.close()
+
+
+def worker_main(stop_event, concurrency: int):
+    """Entry point of a job worker process: run `concurrency` job threads until stopped."""
+    threads = [
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"job-worker-{i}")
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def acquire_pool_lock() -> bool:
+    """Take the host-wide job pool lock; only its holder starts job workers.
+
+    Every uvicorn worker runs the app's lifespan, so without it `--workers N`
+    would start N pools. The lock goes with the process that holds it, so a
+    replacement web worker takes the pool over after a crash.
+    """
+    global _pool_lock_file
+    lock_path = Path(settings.JOBS_DB_PATH).with_suffix(".workers.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _pool_lock_file = lock_file
+    return True
+
+
+def start_workers():
+    global _stop_event
+    if settings.JOB_WORKER_PROCESSES <= 0 or _workers:
+        return
+    if not acquire_pool_lock():
+        logger.info("Job workers are run by another web worker")
+        return
+
+    get_connection().close()  # Create the schema before workers race for it
+    context = multiprocessing.get_context("spawn")
+    _stop_event = context.Event()
+    for i in range(settings.JOB_WORKER_PROCESSES):
+        process = context.Process(
+            target=worker_main,
+            args=(_stop_event, settings.JOB_WORKER_CONCURRENCY),
+            name=f"job-worker-process-{i}"
+        )
+        process.start()
+        _workers.append(process)
+    logger.info(f"Started {len(_workers)} job worker processes "
+                f"({settings.JOB_WORKER_CONCURRENCY} concurrent jobs each)")
+
+
+def stop_workers(timeout: float = 30):
+    global _pool_lock_file
+    if _stop_event is None:
+        return
+    _stop_event.set()
+    for process in _workers:
+        process.join(timeout)
+        if process.is_alive():
+            # In-flight jobs keep their lease and are retried once it expires
+            logger.warning(f"Terminating job worker {process.name}")
+            process.terminate()
+    _workers.clear()
+    _pool_lock_file.close()  # Releases the lock
+    _pool_lock_file = None
+    logger.info("Job workers stopped")
@@ -0,0 +1,166 @@
+import threading
+import time
+import logging
+from app.core.config import settings
+from app.core.metrics import Histogram, DURATION_BUCKETS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PLANES = ("axial", "coronal", "sagittal")
+MODEL_INPUT_SHAPE = (128, 128, 3)
+
+MODELS_NOT_LOADED = "not_loaded"
+MODELS_LOADING = "loading"
+MODELS_READY = "ready"
+MODELS_FAILED = "failed"
+
+MODEL_FORWARD_SECONDS = Histogram(
+    "vizmed_model_forward_seconds",
+    "Duration of one plane model's forward pass over a batch",
+    ["backend", "plane"],
+    buckets=DURATION_BUCKETS
+)
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+class ModelsNotReadyError(RuntimeError):
+    pass
+
+
+def load_keras_models() -> dict:
+    # TensorFlow is imported here, not at module level, so workers that never
+    # classify (or run with classification disabled) don't pay for it
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.utils import get_custom_objects
+    import tensorflow_addons as tfa
+
+    get_custom_objects().update({'Addons>F1Score': tfa.metrics.F1Score})
+    paths = {
+        "axial": settings.AXIAL_MODEL_PATH,
+        "coronal": settings.CORONAL_MODEL_PATH,
+        "sagittal": settings.SAGITTAL_MODEL_PATH,
+    }
+    models = {}
+    for plane, path in paths.items():
+        models[plane] = load_model(path)
+        logger.info(f"{plane.capitalize()} model loaded successfully.")
+    return models
+
+
+def get_model_paths() -> dict:
+    """Model file per plane for the configured INFERENCE_BACKEND."""
+    if settings.INFERENCE_BACKEND == "tflite":
+        return {
+            "axial": settings.AXIAL_TFLITE_MODEL_PATH,
+            "coronal": settings.CORONAL_TFLITE_MODEL_PATH,
+            "sagittal": settings.SAGITTAL_TFLITE_MODEL_PATH,
+        }
+    return {
+        "axial": settings.AXIAL_MODEL_PATH,
+        "coronal": settings.CORONAL_MODEL_PATH,
+        "sagittal": settings.SAGITTAL_MODEL_PATH,
+    }
+
+
+def build_inference_engine():
+    """Load the models for the configured backend and wrap them in an engine."""
+    if settings.INFERENCE_BACKEND == "tflite":
+        from app.services.tflite_engine import TFLiteEngine
+        return TFLiteEngine(get_model_paths(), num_threads=settings.TFLITE_NUM_THREADS or None)
+    if settings.INFERENCE_BACKEND != "keras":
+        raise ValueError(f"Unknown inference backend: {settings.INFERENCE_BACKEND}")
+
+    from app.services.inference_engine import InferenceEngine
+    return InferenceEngine(load_keras_models())
+
+
+class ModelRegistry:
+    """Loads the classification models once, on first use or in the background.
+
+    The engine is built and warmed up (tracing every forward function) before
+    the registry reports ready, so the first request after readiness runs at
+    full speed. A failed load is recorded and retried on the next request.
+    """
+
+    def __init__(self, factory=build_inference_engine):
+        self.factory = factory
+        self.status = MODELS_NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self._engine = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start_background_load(self):
+        with self._lock:
+            if self.status in (MODELS_LOADING, MODELS_READY):
+                return
+            self.status = MODELS_LOADING
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        started = time.monotonic()
+        logger.info(f"Loading pretrained models ({settings.INFERENCE_BACKEND} backend)...")
+        try:
+            engine = self.factory()
+            engine.warm_up()
+        except Exception as e:
+            logger.error(f"Failed to load models: {e}")
+            with self._lock:
+                self.status = MODELS_FAILED
+                self.error = str(e)
+            self._ready.set()
+            return
+
+        with self._lock:
+            self._engine = engine
+            self.status = MODELS_READY
+            self.error = None
+            self.load_seconds = time.monotonic() - started
+        logger.info(f"Models ready after {self.load_seconds:.1f}s")
+        self._ready.set()
+
+    def get_engine(self, timeout: float = None):
+        """Return the warmed-up engine, starting a load if none has been attempted.
+
+        Raises ModelsNotReadyError if the models aren't ready within timeout.
+        """
+        if self.status == MODELS_READY:
+            return self._engine
+        if self.status in (MODELS_NOT_LOADED, MODELS_FAILED):
+            self.start_background_load()
+        self._ready.wait(timeout)
+        if self.status != MODELS_READY:
+            raise ModelsNotReadyError(f"Classification models are {self.status}" + (
+                f": {self.error}" if self.error else ""))
+        return self._engine
+
+    def is_ready(self) -> bool:
+        return self.status == MODELS_READY
+
+    def get_status(self) -> dict:
+        return {"status": self.status, "error": self.error, "load_seconds": self.load_seconds}
+
+
+def get_model_registry() -> ModelRegistry:
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry()
+    return _model_registry
+
+
+def get_model_status() -> dict:
+    """Status of the models this worker classifies with, local or in the model server."""
+    if settings.MODEL_SERVER_ENABLED:
+        from app.services.model_server import get_model_server_client
+        return get_model_server_client().get_status()
+    return get_model_registry().get_status()
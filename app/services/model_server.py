@@ -0,0 +1,174 @@
+"""Dedicated inference process that owns the classification models.
+
+Run it with `python -m app.services.model_server` (or set
+MODEL_SERVER_AUTOSTART) and set MODEL_SERVER_ENABLED in every web worker.
+MODEL_SERVER_AUTHKEY must be set to the same secret in the server and every
+worker: manager connections exchange pickles, so the key is what keeps
+other local processes from executing code in the server.
+Workers then keep no models of their own: preprocessed batches are written
+to a multiprocessing.shared_memory block, the block name goes over a
+BaseManager connection, and only the small probability arrays come back.
+"""
+import subprocess
+import sys
+import threading
+import logging
+from multiprocessing import resource_tracker
+from multiprocessing.managers import BaseManager
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from app.core.config import settings
+from app.services.model_registry import get_model_registry, ModelsNotReadyError, MODEL_INPUT_SHAPE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class ModelServerManager(BaseManager):
+    pass
+
+
+def get_server_address() -> tuple:
+    host, _, port = settings.MODEL_SERVER_ADDRESS.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def get_authkey() -> bytes:
+    if not settings.MODEL_SERVER_AUTHKEY:
+        raise RuntimeError("MODEL_SERVER_AUTHKEY must be set when the model server is used")
+    return settings.MODEL_SERVER_AUTHKEY.encode()
+
+
+def attach_shared_memory(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it on exit; the client owns it
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class ModelService:
+    """Server-side object every web worker calls through its manager proxy.
+
+    Each proxy connection is served on its own thread. Workers already
+    coalesce their own requests with a MicroBatcher, so calls go straight to
+    the engine instead of waiting in a second batching window here.
+    """
+
+    def __init__(self):
+        self.registry = get_model_registry()
+
+    def predict(self, shm_name: str, rows: dict) -> dict:
+        """Classify the batches packed plane after plane in a shared memory block."""
+        shm = attach_shared_memory(shm_name)
+        try:
+            offset = 0
+            batches = {}
+            for plane, count in rows.items():
+                shape = (count, *MODEL_INPUT_SHAPE)
+                view = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=offset)
+                batches[plane] = view.copy()  # Detach from the block so it can be closed right away
+                offset += view.nbytes
+            del view
+        finally:
+            shm.close()
+        engine = self.registry.get_engine(timeout=settings.CLASSIFY_MODEL_WAIT_SECONDS)
+        return engine.predict(batches)
+
+    def get_status(self) -> dict:
+        return self.registry.get_status()
+
+
+class ModelServerClient:
+    """Web-worker side: same predict(batches) contract as InferenceEngine."""
+
+    def __init__(self, address: tuple, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._service = None
+        self._lock = threading.Lock()
+
+    def _get_service(self):
+        with self._lock:
+            if self._service is None:
+                manager = ModelServerManager(address=self.address, authkey=self.authkey)
+                try:
+                    manager.connect()
+                except OSError as e:
+                    raise ModelsNotReadyError(f"Model server at {self.address} is unreachable: {e}")
+                self._service = manager.ModelService()
+            return self._service
+
+    def predict(self, batches: dict) -> dict:
+        arrays = {plane: np.ascontiguousarray(batch, dtype=np.float32) for plane, batch in batches.items()}
+        shm = SharedMemory(create=True, size=sum(array.nbytes for array in arrays.values()))
+        try:
+            offset = 0
+            for array in arrays.values():
+                target = np.ndarray(array.shape, dtype=np.float32, buffer=shm.buf, offset=offset)
+                np.copyto(target, array)
+                offset += array.nbytes
+            del target
+            try:
+                return self._get_service().predict(shm.name, {plane: len(array) for plane, array in arrays.items()})
+            except (EOFError, ConnectionError) as e:
+                self._service = None  # Server restarted, reconnect on the next call
+                raise ModelsNotReadyError(f"Lost connection to model server: {e}")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def get_status(self) -> dict:
+        try:
+            return self._get_service().get_status()
+        except (ModelsNotReadyError, EOFError, ConnectionError) as e:
+            self._service = None
+            return {"status": "unreachable", "error": str(e), "load_seconds": None}
+
+
+ModelServerManager.register("ModelService")
+
+
+def get_model_server_client() -> ModelServerClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelServerClient(get_server_address(), get_authkey())
+    return _client
+
+
+def ensure_model_server():
+    """Start a model server in the background unless one is already answering."""
+    if get_model_server_client().get_status()["status"] != "unreachable":
+        return
+    logger.info(f"Starting model server at {settings.MODEL_SERVER_ADDRESS}")
+    # With several web workers only the first server binds the port, the rest exit
+    subprocess.Popen([sys.executable, "-m", "app.services.model_server"], start_new_session=True)
+
+
+def serve():
+    service = ModelService()
+
+    class ServingManager(BaseManager):
+        pass
+
+    ServingManager.register("ModelService", callable=lambda: service)
+    manager = ServingManager(address=get_server_address(), authkey=get_authkey())
+    # Bind before loading anything: a server started by another worker that
+    # loses the race for the port exits here without loading the models twice
+    server = manager.get_server()
+    service.registry.start_background_load()
+    logger.info(f"Model server listening on {settings.MODEL_SERVER_ADDRESS}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
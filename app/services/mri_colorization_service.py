@@ -1,17 +1,57 @@
 import cv2
 import numpy as np
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
+from app.core.config import settings
+from app.core.metrics import Histogram, DURATION_BUCKETS
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def create_tissue_mask(mri_image: np.ndarray) -> np.ndarray:
-    """Create a mask for non-background (tissue) areas of the MRI image."""
-    _, tissue_mask = cv2.threshold(mri_image, 10, 255, cv2.THRESH_BINARY)
-    logger.info("Tissue mask created for MRI image")
-    return tissue_mask
+# Intensities at or below this are background and stay black
+TISSUE_THRESHOLD = 10
+DEFAULT_CLUSTERS = 4
+# "kmeans" is the original randomized cv2.kmeans, the others work on the histogram
+CLUSTERING_METHODS = ("kmeans", "histogram", "otsu")
+# cv2.kmeans on a whole volume is sampled down to this many pixels
+KMEANS_MAX_SAMPLES = 1 << 18
+
+CLUSTERING_SECONDS = Histogram(
+    "vizmed_clustering_duration_seconds",
+    "Time spent finding the intensity clusters of an image or volume",
+    ["method"],
+    buckets=DURATION_BUCKETS
+)
+
+@lru_cache(maxsize=1)
+def load_color_spectrum() -> np.ndarray:
+    """Decode the color spectrum image once per process."""
+    path = settings.COLOR_SPECTRUM_FILE_PATH
+    if not Path(path).exists():
+        raise FileNotFoundError(f"Color spectrum file not found: {path}")
+    color_spectrum = cv2.imread(path, cv2.IMREAD_COLOR)
+    if color_spectrum is None:
+        raise ValueError(f"Error loading color spectrum image: {path}")
+    logger.info(f"Color spectrum loaded from {path}")
+    return color_spectrum
+
+@lru_cache(maxsize=32)
+def get_cluster_palette(clusters: int = DEFAULT_CLUSTERS) -> np.ndarray:
+    """The spectrum resized to one color per cluster, shape (1, clusters, 3)."""
+    palette = resize_color_spectrum(load_color_spectrum(), clusters)
+    palette.setflags(write=False)  # Shared between requests
+    return palette
+
+def warm_up_colorization():
+    try:
+        get_cluster_palette(DEFAULT_CLUSTERS)
+    except Exception as e:
+        logger.error(f"Could not preload color spectrum: {e}")
 
 def apply_kmeans_clustering(mri_image: np.ndarray, clusters: int = 4) -> tuple:
     """Apply K-means clustering to the MRI image."""
@@ -22,32 +62,200 @@ def apply_kmeans_clustering(mri_image: np.ndarray, clusters: int = 4) -> tuple:
     logger.info(f"K-means clustering applied with {clusters} clusters")
     return labels, centers
 
+def intensity_histogram(mri_image: np.ndarray) -> np.ndarray:
+    return np.bincount(mri_image.ravel(), minlength=256).astype(np.float64)
+
+def apply_histogram_kmeans(mri_image: np.ndarray, clusters: int = 4, max_iterations: int = 100) -> np.ndarray:
+    """1-D k-means over the 256-bin intensity histogram.
+
+    Centers start at evenly spaced quantiles of the histogram, so the same
+    image always gives the same clusters. Each iteration costs O(256 * clusters).
+    """
+    histogram = intensity_histogram(mri_image)
+    intensities = np.arange(256, dtype=np.float64)
+    cumulative = np.cumsum(histogram)
+    quantiles = (np.arange(clusters) + 0.5) / clusters * cumulative[-1]
+    centers = np.searchsorted(cumulative, quantiles).astype(np.float64)
+
+    for _ in range(max_iterations):
+        labels = np.abs(intensities[:, np.newaxis] - centers).argmin(axis=1)
+        weights = np.bincount(labels, weights=histogram, minlength=clusters)
+        sums = np.bincount(labels, weights=histogram * intensities, minlength=clusters)
+        # Empty clusters keep their previous center
+        updated = np.where(weights > 0, sums / np.maximum(weights, 1), centers)
+        if np.allclose(updated, centers, atol=0.01):
+            break
+        centers = updated
+
+    logger.info(f"Histogram k-means applied with {clusters} clusters")
+    return np.sort(updated)
+
+def apply_otsu_multithreshold(mri_image: np.ndarray, clusters: int = 4) -> np.ndarray:
+    """Multi-level Otsu thresholds over the intensity histogram, returned as class means.
+
+    Dynamic programming over the prefix sums finds the split into `clusters`
+    intensity ranges with the least within-class variance (the globally
+    optimal 1-D k-means), in O(256^2 * clusters) without touching pixels again.
+    """
+    histogram = intensity_histogram(mri_image)
+    intensities = np.arange(256, dtype=np.float64)
+    weight = np.concatenate(([0.0], np.cumsum(histogram)))
+    total = np.concatenate(([0.0], np.cumsum(histogram * intensities)))
+    square = np.concatenate(([0.0], np.cumsum(histogram * intensities ** 2)))
+
+    # cost[i, j]: within-class sum of squares of bins i..j-1
+    start, end = np.triu_indices(257, k=1)
+    cost = np.full((257, 257), np.inf)
+    w = weight[end] - weight[start]
+    t = total[end] - total[start]
+    cost[start, end] = square[end] - square[start] - np.divide(t ** 2, w, out=np.zeros_like(t), where=w > 0)
+
+    best = cost[0]
+    splits = []
+    for _ in range(1, clusters):
+        candidates = best[:, np.newaxis] + cost
+        splits.append(candidates.argmin(axis=0))
+        best = candidates.min(axis=0)
+
+    # Walk the split points back from the last bin
+    bounds = [256]
+    for split in reversed(splits):
+        bounds.append(int(split[bounds[-1]]))
+    bounds.append(0)
+    bounds.reverse()
+
+    centers = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        w = weight[high] - weight[low]
+        centers.append((total[high] - total[low]) / w if w > 0 else (low + high - 1) / 2)
+    logger.info(f"Otsu multi-threshold applied with {clusters} classes, thresholds {bounds[1:-1]}")
+    return np.array(centers)
+
+def cluster_intensities(mri_image: np.ndarray, clusters: int = 4, method: str = "kmeans") -> np.ndarray:
+    """Cluster centers for the image with the chosen method (see CLUSTERING_METHODS)."""
+    if method not in CLUSTERING_METHODS:
+        raise ValueError(f"Unknown clustering method: {method}")
+    with CLUSTERING_SECONDS.labels(method=method).time():
+        if method == "kmeans":
+            _, centers = apply_kmeans_clustering(mri_image, clusters)
+            return centers
+        if method == "histogram":
+            return apply_histogram_kmeans(mri_image, clusters)
+        return apply_otsu_multithreshold(mri_image, clusters)
+
 def resize_color_spectrum(color_spectrum: np.ndarray, clusters: int) -> np.ndarray:
     """Resize the color spectrum to match the number of clusters."""
     color_spectrum_resized = cv2.resize(color_spectrum, (clusters, 1))
     logger.info(f"Color spectrum resized to {clusters} clusters")
     return color_spectrum_resized
 
-def map_colors_to_clusters(labels: np.ndarray, centers: np.ndarray, mri_image_shape: tuple) -> np.ndarray:
-    """Map each pixel to its cluster center to create a segmented image."""
-    segmented_image = centers[labels.flatten()].reshape(mri_image_shape)
-    logger.info("Cluster centers mapped to MRI image")
-    return segmented_image
-
-def apply_colorization(segmented_image: np.ndarray, tissue_mask: np.ndarray, color_spectrum: np.ndarray, centers: np.ndarray) -> np.ndarray:
-    """Apply colors to the MRI image based on cluster labels and the color spectrum."""
-    clusters = color_spectrum.shape[1]
-    colorized_image = np.zeros((*segmented_image.shape, 3), dtype=np.uint8)
-    for i in range(clusters):
-        color = color_spectrum[0, i]
-        colorized_image[(segmented_image == centers[i]) & (tissue_mask == 255)] = color
+def build_color_lut(centers: np.ndarray, color_spectrum: np.ndarray) -> np.ndarray:
+    """Build a 256-entry intensity -> color table.
+
+    Every intensity takes the color of its nearest cluster center, and the
+    background (tissue mask) is folded in as black entries.
+    """
+    intensities = np.arange(256, dtype=np.float32)[:, np.newaxis]
+    centers = np.asarray(centers, dtype=np.float32).reshape(1, -1)
+    intensity_labels = np.abs(intensities - centers).argmin(axis=1)
+    lut = color_spectrum[0, intensity_labels].astype(np.uint8)
+    lut[:TISSUE_THRESHOLD + 1] = 0
+    return lut
+
+def apply_colorization(mri_image: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Map every pixel through the color table in one vectorized pass."""
+    colorized_image = lut[mri_image]
     logger.info("MRI image colorization completed successfully")
     return colorized_image
 
-def colorize_mri_image(mri_image: np.ndarray, color_spectrum: np.ndarray, clusters: int = 4) -> np.ndarray:
-    """Main function to colorize an MRI image."""
-    tissue_mask = create_tissue_mask(mri_image)
-    labels, centers = apply_kmeans_clustering(mri_image, clusters)
-    color_spectrum_resized = resize_color_spectrum(color_spectrum, clusters)
-    segmented_image = map_colors_to_clusters(labels, centers, mri_image.shape)
-    return apply_colorization(segmented_image, tissue_mask, color_spectrum_resized, centers)
+def colorize_mri_image(mri_image: np.ndarray, color_spectrum: np.ndarray, clusters: int = 4,
+                       method: str = "kmeans") -> np.ndarray:
+    """Main function to colorize an MRI image.
+
+    color_spectrum may be the full spectrum image or an already resized
+    palette from get_cluster_palette.
+    """
+    centers = cluster_intensities(mri_image, clusters, method)
+    if color_spectrum.shape[:2] != (1, clusters):
+        color_spectrum = resize_color_spectrum(color_spectrum, clusters)
+    return apply_colorization(mri_image, build_color_lut(centers, color_spectrum))
+
+def fit_color_lut(images, color_spectrum: np.ndarray, clusters: int = 4, method: str = "kmeans") -> np.ndarray:
+    """Fit one clustering model over a whole stack and return its color table.
+
+    images is a uint8 volume or a list of 2-D slices. Pooling every slice into
+    a single fit keeps cluster boundaries, and colors, consistent across the
+    stack.
+    """
+    if isinstance(images, np.ndarray):
+        pixels = images.reshape(-1)
+    else:
+        pixels = np.concatenate([image.reshape(-1) for image in images])
+    if method == "kmeans" and pixels.size > KMEANS_MAX_SAMPLES:
+        pixels = pixels[::-(-pixels.size // KMEANS_MAX_SAMPLES)]
+
+    centers = cluster_intensities(pixels, clusters, method)
+    if color_spectrum.shape[:2] != (1, clusters):
+        color_spectrum = resize_color_spectrum(color_spectrum, clusters)
+    return build_color_lut(centers, color_spectrum)
+
+def encode_image(image: np.ndarray, extension: str = ".jpg") -> bytes:
+    success, encoded = cv2.imencode(extension, image)
+    if not success:
+        raise ValueError(f"Could not encode colorized image as {extension}")
+    return encoded.tobytes()
+
+def colorize_and_encode(mri_image: np.ndarray, lut: np.ndarray, extension: str = ".jpg") -> bytes:
+    """Apply a fitted color table to one slice and encode it in memory."""
+    return encode_image(lut[mri_image], extension)
+
+def render_colorized_image(mri_image: np.ndarray, color_spectrum: np.ndarray, clusters: int = 4,
+                           method: str = "kmeans", extension: str = ".jpg") -> bytes:
+    """colorize_mri_image followed by in-memory encoding, so only bytes leave the worker."""
+    return encode_image(colorize_mri_image(mri_image, color_spectrum, clusters, method), extension)
+
+
+class ColorizedImageCache:
+    """Byte-bounded LRU of encoded colorization results keyed by upload content hash."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(image_bytes: bytes, *params) -> str:
+        digest = hashlib.sha256(image_bytes)
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+            return encoded
+
+    def set(self, key: str, encoded: bytes):
+        if len(encoded) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = encoded
+            self._bytes += len(encoded)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from app.core.config import settings
+from app.core.metrics import register_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump whenever classification preprocessing changes, so cached results computed
+# from differently prepared inputs are invalidated like a model change would
+PREPROCESSING_VERSION = 2
+
+_fingerprint_lock = threading.Lock()
+_fingerprint_state = {"stats": None, "fingerprint": None}
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_model_paths() -> list:
+    # Whichever files the configured backend serves, so switching backends invalidates too
+    from app.services.model_registry import get_model_paths as get_backend_model_paths
+    return list(get_backend_model_paths().values())
+
+
+def get_model_fingerprint() -> str:
+    """Content hash of the model files, recomputed only when their size or mtime changes."""
+    paths = get_model_paths()
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            stats.append((path, None, None))
+
+    with _fingerprint_lock:
+        if stats != _fingerprint_state["stats"]:
+            digest = hashlib.sha256(f"preprocessing:{PREPROCESSING_VERSION}".encode())
+            for path, size, _ in stats:
+                digest.update(path.encode())
+                if size is None:
+                    continue
+                with open(path, "rb") as model_file:
+                    for chunk in iter(lambda: model_file.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            _fingerprint_state["stats"] = stats
+            _fingerprint_state["fingerprint"] = digest.hexdigest()[:16]
+            logger.info(f"Model fingerprint: {_fingerprint_state['fingerprint']}")
+        return _fingerprint_state["fingerprint"]
+
+
+class ResultCache:
+    """Classification results keyed by volume content hash and model fingerprint.
+
+    An in-memory LRU is backed by an optional SQLite tier that survives
+    restarts and is shared between workers. Entries expire after ttl_seconds,
+    and when the model fingerprint changes every entry of older models is
+    dropped from both tiers.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: str = None, db_max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.db_max_entries = db_max_entries
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "invalidations": 0}
+
+        if self.db_path:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS classification_results ("
+                    "cache_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+                    "value TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS classification_results_stored_at "
+                    "ON classification_results (stored_at)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def _current_fingerprint(self) -> str:
+        fingerprint = get_model_fingerprint()
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                logger.info("Model files changed, invalidating cached classification results")
+                self._stats["invalidations"] += 1
+            with self._lock:
+                self._memory.clear()
+            if self.db_path:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM classification_results WHERE fingerprint != ?", (fingerprint,))
+            self._fingerprint = fingerprint
+        return fingerprint
+
+    def get(self, content_key: str):
+        fingerprint = self._current_fingerprint()
+        cache_key = f"{fingerprint}:{content_key}"
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._memory.move_to_end(cache_key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+            self._memory.pop(cache_key, None)
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, stored_at FROM classification_results WHERE cache_key = ? AND stored_at >= ?",
+                    (cache_key, now - self.ttl_seconds)
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(cache_key, value, row[1])
+                self._stats["db_hits"] += 1
+                return value
+
+        self._stats["misses"] += 1
+        return None
+
+    def set(self, content_key: str, value):
+        fingerprint = self._current_fingerprint()
+        cache_key = f"{fingerprint}:{content_key}"
+        now = time.time()
+        self._remember(cache_key, value, now)
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO classification_results (cache_key, fingerprint, value, stored_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (cache_key, fingerprint, json.dumps(value), now)
+                )
+                conn.execute("DELETE FROM classification_results WHERE stored_at < ?", (now - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM classification_results WHERE cache_key NOT IN ("
+                    "SELECT cache_key FROM classification_results ORDER BY stored_at DESC LIMIT ?)",
+                    (self.db_max_entries,)
+                )
+
+    def _remember(self, cache_key: str, value, stored_at: float):
+        with self._lock:
+            self._memory[cache_key] = (stored_at, value)
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(
+                    max_entries=settings.CLASSIFY_RESULT_CACHE_MAX_ENTRIES,
+                    ttl_seconds=settings.CLASSIFY_RESULT_CACHE_TTL_SECONDS,
+                    db_path=settings.CLASSIFY_RESULT_CACHE_DB_PATH or None,
+                    db_max_entries=settings.CLASSIFY_RESULT_CACHE_DB_MAX_ENTRIES
+                )
+                register_cache("classification_result", _result_cache.get_stats,
+                               hits=("memory_hits", "db_hits"), entries="memory_entries")
+    return _result_cache
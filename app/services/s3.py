@@ -1,8 +1,11 @@
-import os
 import logging
-from botocore.exceptions import NoCredentialsError
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError, ClientError
+from boto3.s3.transfer import TransferConfig
 from fastapi import HTTPException, status
 from app.core.config import settings
+from app.core.metrics import time_stage
 import boto3
 from pathlib import Path
 
@@ -10,12 +13,26 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize the S3 client
+# Initialize the S3 client. boto3 clients are thread-safe, so this one client
+# and its connection pool are shared by every transfer thread in the process
 s3_client = boto3.client(
     's3',
     region_name=settings.AWS_REGION,
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    endpoint_url=settings.S3_ENDPOINT_URL or None,
+    config=Config(
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": settings.S3_MAX_RETRY_ATTEMPTS, "mode": "adaptive"}
+    )
+)
+
+# Multipart settings used by managed uploads and downloads
+transfer_config = TransferConfig(
+    multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=settings.S3_MULTIPART_PART_SIZE,
+    max_concurrency=settings.S3_TRANSFER_MAX_CONCURRENCY,
+    use_threads=True
 )
 
 
@@ -27,7 +44,8 @@ def download_file_from_s3(s3_key: str, bucket_name: str, local_file_path: Path):
 
 
         logger.info(f"Downloading file from S3: s3://{bucket_name}/{s3_key}")
-        s3_client.download_file(bucket_name, s3_key, str(local_file_path))
+        with time_stage("s3_download"):
+            s3_client.download_file(bucket_name, s3_key, str(local_file_path), Config=transfer_config)
         logger.info(
             f"File downloaded successfully. Local path: {local_file_path}")
 
@@ -47,10 +65,31 @@ def download_file_from_s3(s3_key: str, bucket_name: str, local_file_path: Path):
         )
 
 
+def get_object_etag(s3_key: str, bucket_name: str) -> str:
+    try:
+        response = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        return response["ETag"].strip('"')
+    except NoCredentialsError:
+        logger.error("S3 credentials are missing or incorrect.")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="S3 credentials are missing or incorrect."
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            raise FileNotFoundError(f"S3 object not found: s3://{bucket_name}/{s3_key}")
+        logger.error(f"Failed to read S3 object metadata: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to read S3 object metadata: {str(e)}"
+        )
+
+
 def upload_file_to_s3(file_path: str, s3_key: str, bucket_name: str):
     try:
         logger.info(f"Uploading file to S3: s3://{bucket_name}/{s3_key}")
-        s3_client.upload_file(file_path, bucket_name, s3_key)
+        with time_stage("s3_upload"):
+            s3_client.upload_file(file_path, bucket_name, s3_key, Config=transfer_config)
         logger.info(f"File uploaded successfully. S3 key: {s3_key}")
         return f"s3://{bucket_name}/{s3_key}"
     except NoCredentialsError:
@@ -65,3 +104,119 @@ def upload_file_to_s3(file_path: str, s3_key: str, bucket_name: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload file to S3: {str(e)}"
         )
+
+
+def upload_bytes_to_s3(data: bytes, s3_key: str, bucket_name: str, content_type: str = None):
+    extra_args = {"ContentType": content_type} if content_type else {}
+    with time_stage("s3_upload"):
+        s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=data, **extra_args)
+    return f"s3://{bucket_name}/{s3_key}"
+
+
+def upload_many_to_s3(items, bucket_name: str, content_type: str = None, max_workers: int = None) -> list:
+    """Upload many (data, s3_key) pairs in parallel over the shared client.
+
+    data may be bytes or a local file path; returns the S3 URIs in input order.
+    """
+    def upload(item):
+        data, s3_key = item
+        if isinstance(data, (str, Path)):
+            return upload_file_to_s3(str(data), s3_key, bucket_name)
+        return upload_bytes_to_s3(data, s3_key, bucket_name, content_type)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or settings.S3_TRANSFER_MAX_CONCURRENCY) as executor:
+            uris = list(executor.map(upload, items))
+        logger.info(f"Uploaded {len(uris)} objects to s3://{bucket_name}")
+        return uris
+    except NoCredentialsError:
+        logger.error("S3 credentials are missing or incorrect.")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="S3 credentials are missing or incorrect."
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to upload objects to S3: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload objects to S3: {str(e)}"
+        )
+
+
+class S3MultipartWriter:
+    """Write-only file object that uploads its contents as an S3 multipart upload.
+
+    Data is buffered in memory until a full part is available, so an archive
+    can be streamed to S3 without ever being materialized on disk. The object
+    deliberately has no tell()/seek(), which makes ZipFile fall back to
+    streaming mode with data descriptors.
+    """
+
+    def __init__(self, s3_key: str, bucket_name: str, part_size: int = None):
+        # S3 rejects non-final parts smaller than 5 MiB
+        self.part_size = max(part_size or settings.S3_MULTIPART_PART_SIZE, 5 * 1024 * 1024)
+        self.s3_key = s3_key
+        self.bucket_name = bucket_name
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        logger.info(f"Starting multipart upload to S3: s3://{self.bucket_name}/{self.s3_key}")
+        response = s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=self.s3_key)
+        self.upload_id = response["UploadId"]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.complete()
+        return False
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _upload_part(self, body: bytes):
+        part_number = len(self.parts) + 1
+        with time_stage("s3_upload_part"):
+            response = s3_client.upload_part(
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
+        logger.info(f"Multipart upload completed. S3 key: {self.s3_key}")
+
+    def abort(self):
+        logger.error(f"Aborting multipart upload to S3: s3://{self.bucket_name}/{self.s3_key}")
+        try:
+            s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload: {str(e)}")
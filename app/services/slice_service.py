@@ -0,0 +1,232 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from app.core.config import settings
+from app.core.metrics import register_cache
+from app.services.file_processing import IMAGE_FORMATS, normalize_slices, encode_slice
+from app.services.s3 import get_object_etag
+from app.services.volume_cache import get_volume_cache
+from app.services.volume_services import load_volume, get_volume_data, extract_views
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_slice_service = None
+_slice_service_lock = threading.Lock()
+
+
+class VolumeNotFoundError(LookupError):
+    pass
+
+
+@contextmanager
+def _connect():
+    db_path = Path(settings.VOLUMES_DB_PATH)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS volumes ("
+            "id TEXT PRIMARY KEY, s3_key TEXT NOT NULL, bucket_name TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        with conn:  # Commits on success, rolls back on error
+            yield conn
+    finally:
+        conn.close()
+
+
+def register_volume(volume_id: str, s3_key: str, bucket_name: str):
+    """Record where a volume lives so slices can be served by its id."""
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO volumes (id, s3_key, bucket_name, updated_at) VALUES (?, ?, ?, ?)",
+            (volume_id, s3_key, bucket_name, time.time())
+        )
+
+
+def lookup_volume(volume_id: str):
+    with _connect() as conn:
+        row = conn.execute("SELECT s3_key, bucket_name FROM volumes WHERE id = ?", (volume_id,)).fetchone()
+    return tuple(row) if row else None
+
+
+class OpenVolume:
+    """A cached volume kept pinned and memory-mapped, with its per-view stacks."""
+
+    def __init__(self, s3_key: str, bucket_name: str, etag: str):
+        self.etag = etag
+        self._stack = ExitStack()
+        try:
+            path = self._stack.enter_context(get_volume_cache().fetch(s3_key, bucket_name, etag=etag))
+            nii_img = load_volume(path)
+            self.views = extract_views(get_volume_data(nii_img), nii_img.affine)
+        except BaseException:
+            self._stack.close()
+            raise
+
+    def close(self):
+        self._stack.close()
+
+
+class SliceService:
+    """Renders single slices on demand from memory-mapped cached volumes.
+
+    Recently used volumes stay open (and pinned in the volume cache), and
+    encoded slices are kept in a byte-bounded LRU keyed by the object ETag
+    and render parameters, so scrolling back and forth never re-renders.
+    A volume's ETag is only re-checked against S3 every revalidate_seconds.
+    """
+
+    def __init__(self, max_open_volumes: int, max_cache_bytes: int, revalidate_seconds: float):
+        self.max_open_volumes = max_open_volumes
+        self.max_cache_bytes = max_cache_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._locations = {}  # volume id -> (checked_at, s3_key, bucket_name, etag)
+        self._volumes = OrderedDict()  # (bucket, key, etag) -> OpenVolume
+        self._slices = OrderedDict()  # cache key -> encoded bytes
+        self._slice_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "volume_opens": 0}
+
+    def _resolve(self, volume_id: str):
+        now = time.monotonic()
+        with self._lock:
+            location = self._locations.get(volume_id)
+        if location is not None and now - location[0] <= self.revalidate_seconds:
+            return location[1:]
+
+        found = lookup_volume(volume_id)
+        if found is None:
+            raise VolumeNotFoundError(f"Unknown volume: {volume_id}")
+        s3_key, bucket_name = found
+
+        etag = get_object_etag(s3_key, bucket_name)
+        with self._lock:
+            self._locations[volume_id] = (now, s3_key, bucket_name, etag)
+        return s3_key, bucket_name, etag
+
+    def _open(self, s3_key: str, bucket_name: str, etag: str) -> OpenVolume:
+        key = (bucket_name, s3_key, etag)
+        with self._lock:
+            volume = self._volumes.get(key)
+            if volume is not None:
+                self._volumes.move_to_end(key)
+                return volume
+
+        volume = OpenVolume(s3_key, bucket_name, etag)
+        with self._lock:
+            if key in self._volumes:  # Opened concurrently, keep the first one
+                volume.close()
+                return self._volumes[key]
+            self._volumes[key] = volume
+            self._stats["volume_opens"] += 1
+            while len(self._volumes) > self.max_open_volumes:
+                _, evicted = self._volumes.popitem(last=False)
+                evicted.close()
+        return volume
+
+    def forget(self, volume_id: str):
+        """Drop a volume's cached location, after it has been registered elsewhere."""
+        with self._lock:
+            self._locations.pop(volume_id, None)
+
+    def get_slice(self, volume_id: str, view: str, index: int, window: float = None, level: float = None,
+                  size: int = None, image_format: str = "jpeg", if_none_match=()):
+        """Return (encoded bytes, content type, etag) for one slice of a volume.
+
+        The ETag only depends on the volume and render parameters, so when it
+        is in if_none_match nothing is opened or rendered and the bytes are
+        None. Raises VolumeNotFoundError for unknown ids and IndexError for
+        slice indices outside the view.
+        """
+        s3_key, bucket_name, etag = self._resolve(volume_id)
+        _, _, _, content_type = IMAGE_FORMATS[image_format]
+        cache_key = (bucket_name, s3_key, etag, view, index, window, level, size, image_format)
+        slice_etag = f'"{hashlib.sha1(repr(cache_key).encode()).hexdigest()}"'
+        if slice_etag in if_none_match:
+            return None, content_type, slice_etag
+
+        with self._lock:
+            encoded = self._slices.get(cache_key)
+            if encoded is not None:
+                self._slices.move_to_end(cache_key)
+                self._stats["hits"] += 1
+                return encoded, content_type, slice_etag
+            self._stats["misses"] += 1
+
+        stack = self._open(s3_key, bucket_name, etag).views[view]
+        if not 0 <= index < len(stack):
+            raise IndexError(f"Slice index {index} out of range for {view} (0-{len(stack) - 1})")
+
+        encoded = render_slice(stack[index], window, level, size, image_format)
+        if encoded is None:
+            raise ValueError(f"Could not encode {view} slice {index}")
+        with self._lock:
+            if cache_key not in self._slices:
+                self._slices[cache_key] = encoded
+                self._slice_bytes += len(encoded)
+            while self._slice_bytes > self.max_cache_bytes and self._slices:
+                _, evicted = self._slices.popitem(last=False)
+                self._slice_bytes -= len(evicted)
+        return encoded, content_type, slice_etag
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(
+                self._stats,
+                open_volumes=len(self._volumes),
+                cached_slices=len(self._slices),
+                cached_bytes=self._slice_bytes,
+                max_cache_bytes=self.max_cache_bytes
+            )
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def render_slice(slice_data, window: float = None, level: float = None, size: int = None, image_format: str = "jpeg"):
+    """Window, resize and encode one 2D slice.
+
+    Without a window the slice is min-max normalized on its own, matching the
+    slices rendered by /file-processing. size bounds the longer edge.
+    """
+    pil_format, _, dtype, _ = IMAGE_FORMATS[image_format]
+    pixels = np.asarray(slice_data, dtype=np.float32)
+
+    # Resample raw intensities first, float images resize at any bit depth
+    if size and max(pixels.shape) != size:
+        ratio = size / max(pixels.shape)
+        height, width = (max(1, round(edge * ratio)) for edge in pixels.shape)
+        pixels = np.asarray(Image.fromarray(pixels).resize((width, height), Image.BILINEAR))
+
+    if window is None or level is None:
+        pixels = normalize_slices(pixels[np.newaxis], dtype=dtype)[0]
+    else:
+        scale = np.iinfo(dtype).max
+        pixels = (pixels - (level - window / 2)) * (scale / window)
+        pixels = np.clip(pixels, 0, scale, out=pixels).astype(dtype)
+
+    return encode_slice(pixels, pil_format, settings.SLICE_IMAGE_QUALITY if pil_format != "PNG" else None)
+
+
+def get_slice_service() -> SliceService:
+    global _slice_service
+    if _slice_service is None:
+        with _slice_service_lock:
+            if _slice_service is None:
+                _slice_service = SliceService(
+                    max_open_volumes=settings.SLICE_OPEN_VOLUMES_MAX,
+                    max_cache_bytes=settings.SLICE_CACHE_MAX_BYTES,
+                    revalidate_seconds=settings.SLICE_VOLUME_REVALIDATE_SECONDS
+                )
+                register_cache("slice", _slice_service.get_stats, entries="cached_slices", size="cached_bytes")
+    return _slice_service
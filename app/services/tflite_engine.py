@@ -0,0 +1,91 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from app.services.model_registry import MODEL_INPUT_SHAPE, MODEL_FORWARD_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_interpreter_class():
+    # The standalone runtime is a few MB and doesn't pull in TensorFlow; fall
+    # back to the interpreter bundled with TF when it isn't installed
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter
+
+
+class TFLitePlaneModel:
+    """One converted plane model. Interpreters aren't thread-safe, so calls are serialized."""
+
+    def __init__(self, model_path: str, num_threads: int = None):
+        self.model_path = model_path
+        # XNNPACK is the default CPU delegate for float and int8 TFLite models
+        self.interpreter = get_interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        dtype = self._input["dtype"]
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output: np.ndarray) -> np.ndarray:
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], [len(batch), *MODEL_INPUT_SHAPE])
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self._input["index"], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output["index"]))
+
+
+class TFLiteEngine:
+    """Drop-in replacement for InferenceEngine running converted .tflite models.
+
+    See scripts/convert_models.py for producing the models. No Keras model
+    or tensorflow_addons is needed at runtime.
+    """
+
+    def __init__(self, model_paths: dict, num_threads: int = None):
+        self.models = {
+            plane: TFLitePlaneModel(path, num_threads)
+            for plane, path in model_paths.items()
+        }
+        self._executor = ThreadPoolExecutor(max_workers=len(self.models), thread_name_prefix="tflite")
+
+    def predict_plane(self, plane: str, batch: np.ndarray) -> np.ndarray:
+        """Return class probabilities for a (N, 128, 128, 3) batch of one plane."""
+        with MODEL_FORWARD_SECONDS.labels(backend="tflite", plane=plane).time():
+            return self.models[plane].predict(np.ascontiguousarray(batch, dtype=np.float32))
+
+    def predict(self, batches: dict) -> dict:
+        """Run every plane's batch concurrently and return probabilities per plane."""
+        futures = {
+            plane: self._executor.submit(self.predict_plane, plane, batch)
+            for plane, batch in batches.items()
+        }
+        return {plane: future.result() for plane, future in futures.items()}
+
+    def warm_up(self, batch_size: int = 1):
+        """Allocate tensors for the common batch size so the first request doesn't pay for it."""
+        logger.info("Warming up TFLite engine.")
+        dummy = np.zeros((batch_size, *MODEL_INPUT_SHAPE), dtype=np.float32)
+        self.predict({plane: dummy for plane in self.models})
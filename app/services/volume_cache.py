@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from app.core.config import settings
+from app.core.metrics import register_cache
+from app.services.s3 import download_file_from_s3, get_object_etag
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Partial downloads untouched for this long were abandoned by a dead process
+PARTIAL_STALE_SECONDS = 3600
+
+_volume_cache = None
+_volume_cache_lock = threading.Lock()
+
+
+def _file_suffix(s3_key: str) -> str:
+    # nibabel picks the reader from the extension, so keep it on cached files
+    name = Path(s3_key).name
+    if name.endswith(".nii.gz"):
+        return ".nii.gz"
+    return Path(name).suffix
+
+
+class VolumeCache:
+    """Content-addressed on-disk LRU cache of S3 objects, shared by every process.
+
+    Entries are keyed by bucket, key and ETag, so a re-uploaded object never
+    serves stale data. The directory itself is the index: any process uses a
+    file another one downloaded, and eviction scans it, so max_bytes bounds
+    the disk rather than one process. Entries in use hold a shared flock and
+    are skipped by eviction, and concurrent misses for the same object (in
+    any process) share one download through a per-entry lock file. Files
+    derived from entries, like decompressed volumes, live here too and count
+    against the same budget.
+    """
+
+    def __init__(self, cache_dir, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.lock_dir = self.cache_dir / ".locks"
+        self.max_bytes = max_bytes
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        stale_before = time.time() - PARTIAL_STALE_SECONDS
+        for path in self.cache_dir.glob("*.partial"):
+            try:
+                # Fresh partials may be downloads in progress in another process
+                if path.stat().st_mtime < stale_before:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        for lock_path in self.lock_dir.glob("*.lock"):
+            if not (self.cache_dir / lock_path.stem).exists():
+                self._remove_lock_file(lock_path)  # Left behind by an entry evicted or never built
+        logger.info(f"Volume cache initialized with {len(self._scan())} entries")
+
+    @staticmethod
+    def entry_name(s3_key: str, bucket_name: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{bucket_name}/{s3_key}@{etag}".encode()).hexdigest()
+        return digest + _file_suffix(s3_key)
+
+    @contextmanager
+    def fetch(self, s3_key: str, bucket_name: str, etag: str = None):
+        """Yield a local path for the object, downloading it on a miss.
+
+        The entry stays pinned (safe from eviction by any process) until the block exits.
+        """
+        etag = etag or get_object_etag(s3_key, bucket_name)
+        name = self.entry_name(s3_key, bucket_name, etag)
+        pin = self._acquire(name, lambda partial: download_file_from_s3(s3_key, bucket_name, partial))
+        try:
+            yield self.cache_dir / name
+        finally:
+            pin.close()  # Releases the shared lock
+            self._evict()
+
+    def open_entry(self, name: str, build):
+        """Open a pinned entry built locally, calling build(path) to write it on a miss.
+
+        The entry is safe from eviction by any process until the returned file is closed.
+        """
+        return self._acquire(name, build)
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _pin(self, path: Path):
+        """Open the entry with a shared lock, or return None if it isn't cached."""
+        try:
+            pin = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        fcntl.flock(pin, fcntl.LOCK_SH)
+        try:
+            # Eviction may have unlinked the file between open and flock
+            if os.fstat(pin.fileno()).st_ino == os.stat(path).st_ino:
+                os.utime(path)  # Last use, for LRU ordering
+                return pin
+        except FileNotFoundError:
+            pass
+        pin.close()
+        return None
+
+    def _acquire(self, name: str, build):
+        path = self.cache_dir / name
+        pin = self._pin(path)
+        if pin is not None:
+            self._count("hits")
+            return pin
+
+        while True:
+            with open(self._lock_path(name), "wb") as download_lock:
+                # Held while building, so other requests for the entry wait for this one
+                fcntl.flock(download_lock, fcntl.LOCK_EX)
+                pin = self._pin(path)
+                if pin is not None:
+                    self._count("coalesced")
+                    return pin
+
+                self._count("misses")
+                self._build(path, build)
+                pin = self._pin(path)
+            if pin is not None:  # Otherwise another process evicted it already, fetch again
+                self._evict()
+                return pin
+
+    def _build(self, path: Path, build):
+        partial = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.partial")
+        try:
+            build(partial)
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    def _lock_path(self, name: str) -> Path:
+        return self.lock_dir / f"{name}.lock"
+
+    @staticmethod
+    def _remove_lock_file(lock_path: Path):
+        try:
+            with open(lock_path, "rb") as lock_file:
+                # Skipped while a build holds it
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                lock_path.unlink()
+        except (BlockingIOError, FileNotFoundError):
+            pass
+
+    def _scan(self) -> list:
+        """(last use, path, size) of every cached entry, least recently used first."""
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.endswith(".partial") or path == self.lock_dir:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                with open(path, "rb") as entry:
+                    # Entries pinned by any process hold a shared lock
+                    fcntl.flock(entry, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    path.unlink()
+                    self._remove_lock_file(self._lock_path(path.name))
+            except (BlockingIOError, FileNotFoundError):
+                continue
+            total -= size
+            self._count("evictions")
+            logger.info(f"Evicted volume from cache: {path.name}")
+
+    def get_stats(self) -> dict:
+        entries = self._scan()
+        with self._stats_lock:
+            stats = {
+                "hits": self._stats["hits"],
+                "misses": self._stats["misses"],
+                "coalesced": self._stats["coalesced"],
+                "evictions": self._stats["evictions"],
+            }
+        stats.update(entries=len(entries), bytes=sum(size for _, _, size in entries), max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def get_volume_cache() -> VolumeCache:
+    global _volume_cache
+    if _volume_cache is None:
+        with _volume_cache_lock:
+            if _volume_cache is None:
+                _volume_cache = VolumeCache(
+                    Path(settings.VOLUME_CACHE_DIR) / "objects",
+                    settings.VOLUME_CACHE_MAX_BYTES
+                )
+                # Entries live on a disk shared by every process, so only this process's lookups are exported
+                register_cache("volume", _volume_cache.get_stats)
+    return _volume_cache
@@ -0,0 +1,151 @@
+import nibabel as nib
+import numpy as np
+import gzip
+import hashlib
+import shutil
+import weakref
+import logging
+from pathlib import Path
+from app.core.metrics import time_stage
+from app.services.volume_cache import get_volume_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Anatomical plane for each orientation code returned by nib.aff2axcodes
+VIEW_AXIS_CODES = {
+    "axial": "S",
+    "coronal": "A",
+    "sagittal": "R",
+}
+
+
+class ProxyAxisView:
+    """Lazy stack over a nibabel array proxy, sliced along one voxel axis.
+
+    Indexing reads (and scales) only the requested slab from disk, with the
+    slicing axis moved to the front like np.moveaxis would.
+    """
+
+    def __init__(self, dataobj, axis: int):
+        self.dataobj = dataobj
+        self.axis = axis
+        shape = list(dataobj.shape)
+        self.shape = (shape.pop(axis), *shape)
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        slicer = [slice(None)] * len(self.dataobj.shape)
+        slicer[self.axis] = index
+        data = self.dataobj[tuple(slicer)]
+        if isinstance(index, slice):
+            return np.moveaxis(data, self.axis, 0)
+        return data
+
+
+def open_decompressed(file_path):
+    """Decompress a .nii.gz once into the volume cache and return the .nii opened and pinned.
+
+    Decompressed copies share the volume cache's disk budget and LRU eviction,
+    and concurrent requests for the same file (in any process) decompress it once.
+    """
+    source = Path(file_path)
+    stat = source.stat()
+    fingerprint = f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    name = f"{hashlib.sha1(fingerprint.encode()).hexdigest()}.nii"
+
+    def decompress(target: Path):
+        logger.info(f"Decompressing {source} into volume cache: {target}")
+        with gzip.open(source, "rb") as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    return get_volume_cache().open_entry(name, decompress)
+
+
+def load_volume(file_path):
+    """Open a NIfTI image without reading its voxel data into memory.
+
+    Uncompressed files are memory-mapped in place; gzipped files are
+    decompressed to the local cache once and memory-mapped from there. The
+    decompressed copy stays pinned in the cache while the image's array
+    proxy is alive, since scaled volumes re-read it by path for every slab.
+    """
+    with time_stage("nifti_load"):
+        path = Path(file_path)
+        if not path.name.endswith(".gz"):
+            logger.info(f"Loading NIfTI volume: {path}")
+            return nib.load(str(path), mmap="r")
+        pin = open_decompressed(path)
+        try:
+            logger.info(f"Loading NIfTI volume: {pin.name}")
+            nii_img = nib.load(pin.name, mmap="r")
+        except BaseException:
+            pin.close()
+            raise
+        weakref.finalize(nii_img.dataobj, pin.close)
+        return nii_img
+
+
+def get_volume_data(nii_image):
+    """Return the voxel data of a loaded image in its on-disk dtype.
+
+    Unscaled images come back as a read-only memmap. Images with a
+    scl_slope/scl_inter are left as the nibabel proxy so scaling is applied
+    per slab rather than to a float copy of the whole volume.
+    """
+    dataobj = nii_image.dataobj
+    if not nib.is_proxy(dataobj) or (dataobj.slope == 1 and dataobj.inter == 0):
+        return np.asanyarray(dataobj)
+    return dataobj
+
+
+def determine_axes(affine):
+    logger.info("Determining the axes for slice extraction.")
+    orientation = nib.aff2axcodes(affine)
+    plane_to_axis = {'R': None, 'A': None, 'S': None}
+    for idx, axis in enumerate(orientation):
+        if axis in ('R', 'L'):
+            plane_to_axis['R'] = idx  # Sagittal
+        elif axis in ('A', 'P'):
+            plane_to_axis['A'] = idx  # Coronal
+        elif axis in ('S', 'I'):
+            plane_to_axis['S'] = idx  # Axial
+    logger.info(f"Axes determined: {plane_to_axis}")
+    return plane_to_axis
+
+
+def get_view_axes(affine):
+    """Map each view name to the voxel axis it is sliced along."""
+    plane_to_axis = determine_axes(affine)
+
+    # Fall back to RAS voxel order for any axis the affine doesn't resolve
+    defaults = {'R': 0, 'A': 1, 'S': 2}
+    if None in plane_to_axis.values():
+        logger.warning(f"Could not resolve orientation {plane_to_axis}, assuming RAS voxel order.")
+        plane_to_axis = defaults
+
+    return {view: plane_to_axis[code] for view, code in VIEW_AXIS_CODES.items()}
+
+
+def extract_views(volume, affine):
+    """Return axial, sagittal and coronal stacks as zero-copy views of the volume.
+
+    Each stack has its slicing axis moved to the front so that iterating it
+    yields 2D slices in the corresponding anatomical plane. Array proxies
+    from get_volume_data are wrapped so slabs are only read when indexed.
+    """
+    with time_stage("view_extraction"):
+        view_axes = get_view_axes(affine)
+        if isinstance(volume, np.ndarray):
+            return {
+                view: np.moveaxis(volume, view_axes[view], 0)
+                for view in ("axial", "sagittal", "coronal")
+            }
+        return {
+            view: ProxyAxisView(volume, view_axes[view])
+            for view in ("axial", "sagittal", "coronal")
+        }
@@ -0,0 +1,92 @@
+"""Compare /classify inference latency: sequential model.predict vs InferenceEngine.
+
+Usage:
+    python -m scripts.benchmark_classification [--iterations 50] [--batch-size 1] [--synthetic]
+
+Without --synthetic the models configured in Settings (AXIAL_MODEL_PATH etc.)
+are loaded, which needs the usual .env. --synthetic benchmarks small
+stand-in CNNs with the same input/output shape instead.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from app.services.inference_engine import InferenceEngine, PLANES, MODEL_INPUT_SHAPE
+
+
+def build_synthetic_model():
+    return tf.keras.Sequential([
+        tf.keras.layers.Input(MODEL_INPUT_SHAPE),
+        tf.keras.layers.Conv2D(32, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Conv2D(64, 3, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(5, activation="softmax"),
+    ])
+
+
+def load_models(synthetic: bool) -> dict:
+    if synthetic:
+        return {plane: build_synthetic_model() for plane in PLANES}
+
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.utils import get_custom_objects
+    import tensorflow_addons as tfa
+    from app.core.config import settings
+
+    get_custom_objects().update({'Addons>F1Score': tfa.metrics.F1Score})
+    return {
+        "axial": load_model(settings.AXIAL_MODEL_PATH),
+        "coronal": load_model(settings.CORONAL_MODEL_PATH),
+        "sagittal": load_model(settings.SAGITTAL_MODEL_PATH),
+    }
+
+
+def measure(fn, iterations: int) -> list:
+    fn()  # Warm-up, excluded from the numbers
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<24} p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    models = load_models(args.synthetic)
+    engine = InferenceEngine(models)
+    batch = np.random.rand(args.batch_size, *MODEL_INPUT_SHAPE).astype(np.float32)
+
+    def baseline():
+        for plane in PLANES:
+            models[plane].predict(batch, verbose=0)
+
+    def engine_predict():
+        engine.predict({plane: batch for plane in PLANES})
+
+    baseline_timings = measure(baseline, args.iterations)
+    engine_timings = measure(engine_predict, args.iterations)
+
+    report("sequential predict()", baseline_timings)
+    report("InferenceEngine", engine_timings)
+    speedup = statistics.median(baseline_timings) / statistics.median(engine_timings)
+    print(f"p50 speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark the S3 transfer helpers against an S3-compatible endpoint.
+
+Start a local stand-in first, e.g. `moto_server -p 5000`, then:
+    python -m scripts.benchmark_s3_transfer --endpoint-url http://127.0.0.1:5000
+
+Compares a default boto3 client with the tuned shared client in
+app.services.s3 for a large download, an in-memory ranged download, and a
+bulk upload of many small objects (a rendered slice set).
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def timed(label: str, fn, size_bytes: int = None):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    rate = f"  {size_bytes / elapsed / 1024 ** 2:8.1f} MiB/s" if size_bytes else ""
+    print(f"{label:<40} {elapsed * 1000:9.1f} ms{rate}")
+
+
+def download_to_memory(client, s3_key: str, bucket_name: str, part_size: int, max_workers: int) -> bytes:
+    """Read an object as parallel ranged GETs written into one preallocated buffer."""
+    size = client.head_object(Bucket=bucket_name, Key=s3_key)["ContentLength"]
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def fetch_part(start):
+        end = min(start + part_size, size) - 1
+        body = client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes={start}-{end}")["Body"]
+        offset = start
+        for chunk in body.iter_chunks(1024 * 1024):
+            view[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fetch_part, range(0, size, part_size)))
+    return bytes(buffer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", required=True)
+    parser.add_argument("--bucket", default="transfer-benchmark")
+    parser.add_argument("--object-mb", type=int, default=128)
+    parser.add_argument("--objects", type=int, default=256, help="Number of small objects for the bulk upload")
+    parser.add_argument("--object-kb", type=int, default=24)
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure them before importing the app
+    os.environ["S3_ENDPOINT_URL"] = args.endpoint_url
+    for name, value in {
+        "S3_BUCKET": args.bucket, "S3_BUCKET_NAME": args.bucket, "API_KEYS": "[]",
+        "AWS_REGION": "us-east-1", "AWS_ACCESS_KEY_ID": "benchmark", "AWS_SECRET_ACCESS_KEY": "benchmark",
+    }.items():
+        os.environ.setdefault(name, value)
+
+    import boto3
+    from app.core.config import settings
+    from app.services import s3
+
+    default_client = boto3.client(
+        "s3", endpoint_url=args.endpoint_url, region_name=settings.AWS_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
+    try:
+        s3.s3_client.create_bucket(Bucket=args.bucket)
+    except s3.s3_client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    large_size = args.object_mb * 1024 ** 2
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "volume.bin")
+        with open(source, "wb") as f:
+            f.write(os.urandom(large_size))
+
+        timed("upload_file (default client)",
+              lambda: default_client.upload_file(source, args.bucket, "bench/default.bin"), large_size)
+        timed("upload_file_to_s3 (tuned)",
+              lambda: s3.upload_file_to_s3(source, "bench/volume.bin", args.bucket), large_size)
+        timed("download_file (default client)",
+              lambda: default_client.download_file(args.bucket, "bench/volume.bin", os.path.join(tmp, "a.bin")),
+              large_size)
+        timed("download_file_from_s3 (tuned)",
+              lambda: s3.download_file_from_s3("bench/volume.bin", args.bucket, s3.Path(tmp) / "b.bin"),
+              large_size)
+        timed("download_to_memory (parallel ranges)",
+              lambda: download_to_memory(s3.s3_client, "bench/volume.bin", args.bucket,
+                                         settings.S3_MULTIPART_PART_SIZE, settings.S3_TRANSFER_MAX_CONCURRENCY),
+              large_size)
+
+    items = [(os.urandom(args.object_kb * 1024), f"bench/slices/slice{i}.jpg") for i in range(args.objects)]
+    total = args.objects * args.object_kb * 1024
+    timed(f"sequential put_object x{args.objects}",
+          lambda: [default_client.put_object(Bucket=args.bucket, Key=key, Body=data) for data, key in items], total)
+    timed(f"upload_many_to_s3 x{args.objects}",
+          lambda: s3.upload_many_to_s3(items, args.bucket, content_type="image/jpeg"), total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Convert the per-plane Keras classifiers to TFLite and check accuracy parity.
+
+Usage:
+    python -m scripts.convert_models [--quantize none|float16|int8]
+        [--calibration-volumes a.nii.gz b.nii.gz ...] [--min-agreement 0.98]
+
+The models configured in Settings (AXIAL_MODEL_PATH etc.) are converted,
+both versions are run on the same inputs and compared, and only when every
+plane passes are the results moved to AXIAL_TFLITE_MODEL_PATH etc.
+Calibration volumes provide realistic inputs, preprocessed exactly like
+/classify does; int8 quantization needs them for its representative
+dataset, otherwise random inputs are used. Set INFERENCE_BACKEND=tflite to serve the converted models.
+
+--synthetic converts small stand-in CNNs instead, like benchmark_classification.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from app.core.config import settings
+from app.services.model_registry import PLANES, MODEL_INPUT_SHAPE, load_keras_models
+from app.services.tflite_engine import TFLitePlaneModel
+
+
+def get_output_paths() -> dict:
+    return {
+        "axial": settings.AXIAL_TFLITE_MODEL_PATH,
+        "coronal": settings.CORONAL_TFLITE_MODEL_PATH,
+        "sagittal": settings.SAGITTAL_TFLITE_MODEL_PATH,
+    }
+
+
+def load_models(synthetic: bool) -> dict:
+    if synthetic:
+        from scripts.benchmark_classification import build_synthetic_model
+        return {plane: build_synthetic_model() for plane in PLANES}
+    return load_keras_models()
+
+
+def build_calibration_inputs(volume_paths: list, samples: int) -> dict:
+    """Model inputs per plane: slices spread over the central part of each volume."""
+    if not volume_paths:
+        rng = np.random.default_rng(0)
+        return {plane: rng.random((samples, *MODEL_INPUT_SHAPE), dtype=np.float32) for plane in PLANES}
+
+    from app.services.classification_services import load_views, preprocess_slices
+
+    per_volume = max(1, samples // len(volume_paths))
+    inputs = {plane: [] for plane in PLANES}
+    for path in volume_paths:
+        views, intensity_range, _ = load_views(path)
+        for plane in PLANES:
+            count = len(views[plane])
+            indices = np.linspace(count * 0.2, count * 0.8, per_volume).astype(int)
+            slices = [np.asarray(views[plane][i]) for i in indices]
+            inputs[plane].append(np.array(preprocess_slices(slices, intensity_range)))
+    return {plane: np.concatenate(batches) for plane, batches in inputs.items()}
+
+
+def convert(model, quantize: str, calibration: np.ndarray) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([row[np.newaxis]] for row in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def check_parity(plane: str, model, tflite_path: str, inputs: np.ndarray) -> float:
+    start = time.perf_counter()
+    expected = model(inputs, training=False).numpy()
+    keras_ms = (time.perf_counter() - start) * 1000
+
+    tflite_model = TFLitePlaneModel(tflite_path)
+    tflite_model.predict(inputs)  # Allocate for this batch size outside the timing
+    start = time.perf_counter()
+    actual = tflite_model.predict(inputs)
+    tflite_ms = (time.perf_counter() - start) * 1000
+
+    agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+    difference = np.abs(expected - actual)
+    print(f"{plane:<9} top-1 agreement={agreement:6.1%}  max |dp|={difference.max():.4f}  "
+          f"mean |dp|={difference.mean():.5f}  keras={keras_ms:7.1f} ms  tflite={tflite_ms:7.1f} ms")
+    return agreement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quantize", choices=("none", "float16", "int8"), default="none")
+    parser.add_argument("--calibration-volumes", nargs="*", default=[])
+    parser.add_argument("--samples", type=int, default=64, help="Inputs per plane for calibration and parity")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    models = load_models(args.synthetic)
+    inputs = build_calibration_inputs(args.calibration_volumes, args.samples)
+    output_paths = get_output_paths()
+
+    # Converted models stay beside their targets until every plane passes, so a
+    # failed run never leaves the serving paths with unchecked or mixed models
+    candidate_paths = {plane: f"{path}.candidate" for plane, path in output_paths.items()}
+    agreements = {}
+    try:
+        for plane in PLANES:
+            os.makedirs(os.path.dirname(output_paths[plane]), exist_ok=True)
+            with open(candidate_paths[plane], "wb") as f:
+                f.write(convert(models[plane], args.quantize, inputs[plane]))
+            print(f"Converted {plane} ({os.path.getsize(candidate_paths[plane]) / 1024 ** 2:.1f} MiB)")
+            agreements[plane] = check_parity(plane, models[plane], candidate_paths[plane], inputs[plane])
+
+        if min(agreements.values()) < args.min_agreement:
+            print(f"Parity check failed: top-1 agreement below {args.min_agreement:.0%}, models left unchanged")
+            sys.exit(1)
+        for plane in PLANES:
+            os.replace(candidate_paths[plane], output_paths[plane])
+            print(f"Wrote {output_paths[plane]}")
+    finally:
+        for path in candidate_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+    print("Parity check passed")
+
+
+if __name__ == "__main__":
+    main()